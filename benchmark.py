@@ -0,0 +1,323 @@
+"""
+效能基準測試: 測量 PdfInfo 擷取流程與 MultiModalRetriever 建立索引 / 搜尋的吞吐量與延遲
+每個測試在獨立的 process 中執行，peak RSS 只包含該測試本身
+
+用法:
+    python benchmark.py --stub                              # 模型推論以固定輸出取代，只測量其餘的處理
+    python benchmark.py --stub --scale 1 4 16               # 另外把 example_pdfs 重複 4 / 16 次組成較大的文件
+    python benchmark.py --stub --compare benchmarks/a.json  # 與之前的結果比較，退步超過 --threshold 時 exit code 為 1
+
+結果存成 JSON ({output}/bench_{時間}.json)，內容包含:
+    extract:*   pages_per_s, images_per_s, page_p50_ms, page_p99_ms, peak_rss_mb, stages (見 converter.stats)
+    retriever:* add_images_per_s, queries_per_s, batch_queries_per_s (search_batch), query_p50_ms, query_p99_ms, peak_rss_mb
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+
+# 數值越大越好 / 越小越好的指標，compare 時使用
+HIGHER_IS_BETTER = ("pages_per_s", "images_per_s", "add_images_per_s", "queries_per_s", "batch_queries_per_s")
+LOWER_IS_BETTER = ("page_p50_ms", "page_p99_ms", "query_p50_ms", "query_p99_ms", "peak_rss_mb")
+
+SYNTHETIC_WORDS = ["香菇", "甘草", "種植", "土壤", "溫度", "濕度", "病蟲害", "施肥", "產量", "品種", "灌溉", "收成", "figure", "table", "yield", "growth"]
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return None # Windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 的單位是 KB，macOS 是 bytes
+    return round(rss / (1 << 20) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def percentile_ms(seconds: list, q: float) -> float:
+    if not seconds:
+        return None
+    return round(float(np.percentile(np.asarray(seconds) * 1000, q)), 3)
+
+
+# ----------------------------
+# Stubs
+# ----------------------------
+class _StubOcrModel:
+    def predict(self, images, **kwargs):
+        n = len(images) if isinstance(images, list) else 1
+        return [{"rec_texts": []} for _ in range(n)]
+
+
+class _StubLayoutModel:
+    def predict(self, images, **kwargs):
+        return [{"boxes": []} for _ in images]
+
+
+class StubEncoder:
+    """
+    與 SentenceTransformer.encode 介面相同，以輸入內容的雜湊產生固定的單位向量
+    """
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def encode(self, items, batch_size=32, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False):
+        out = np.empty((len(items), self.dim), dtype=np.float32)
+        for i, item in enumerate(items):
+            data = item.encode("utf-8") if isinstance(item, str) else item.tobytes()
+            seed = int.from_bytes(hashlib.sha1(data).digest()[:8], "little")
+            v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            out[i] = v / np.linalg.norm(v)
+        return out
+
+
+# ----------------------------
+# Corpora
+# ----------------------------
+def build_scaled_pdf(pdf_paths: list, scale: int, out_path: str) -> str:
+    """
+    將 pdf_paths 依序重複 scale 次合併成一份文件
+    """
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    for _ in range(scale):
+        for p in pdf_paths:
+            with fitz.open(p) as src:
+                doc.insert_pdf(src)
+    doc.save(out_path)
+    doc.close()
+    return out_path
+
+
+def build_synthetic_folder(folder: str, n_images: int, seed: int = 0) -> str:
+    """
+    產生與 PdfInfo 輸出相同結構 (metadata.json + 圖片) 的資料夾，所有項目共用同一張小圖片
+    """
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    Image.fromarray(rng.integers(0, 255, (32, 32, 3), dtype=np.uint8)).save(os.path.join(folder, "image.png"))
+
+    def sentence(n):
+        return "".join(rng.choice(SYNTHETIC_WORDS, n))
+
+    imgs = []
+    for i in range(n_images):
+        imgs.append({
+            "name": f"image_{i:06d}",
+            "file": "image.png",
+            "page": i // 4 + 1,
+            "coordinate": [0, 0, 32, 32],
+            "figure_title": f"圖 {i} {sentence(4)}",
+            "surrounding_texts": [sentence(30) for _ in range(3)],
+        })
+    with open(os.path.join(folder, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump({"name": "synthetic", "uid": "synthetic", "imgs": imgs}, f, ensure_ascii=False)
+    return folder
+
+
+# ----------------------------
+# Cases (在子 process 中執行)
+# ----------------------------
+def run_extract_case(pdf_path: str, stub: bool, dpi: int, window: int, route: str, optimize_resolution: bool) -> dict:
+    from converter import PdfInfo, model_pool
+    out_dir = tempfile.mkdtemp(prefix="bench_extract_")
+    try:
+        pdf = PdfInfo(pdf_path)
+        if stub:
+            pdf.ocr_engine = model_pool.OcrEngine("stub", "stub", "cpu")
+            pdf.ocr_engine._model = _StubOcrModel()
+            pdf.layout_engine = model_pool.LayoutEngine("stub", "cpu")
+            pdf.layout_engine._model = _StubLayoutModel()
+        else:
+            pdf.warmup_models() # 模型載入時間不計入
+
+        page_seconds = []
+        images = 0
+        start = last = time.perf_counter()
+        for page_index, imgdatas in pdf.iter_pages(dpi=dpi, window=window, route=route, optimize_resolution=optimize_resolution):
+            for k, img_data in enumerate(imgdatas):
+                pdf._export_image_data(img_data, f"image_{page_index:05d}_{k:03d}", out_dir)
+            images += len(imgdatas)
+            now = time.perf_counter()
+            page_seconds.append(now - last)
+            last = now
+        seconds = time.perf_counter() - start
+        pages = len(page_seconds)
+        return {
+            "pages": pages,
+            "images": images,
+            "seconds": round(seconds, 4),
+            "pages_per_s": round(pages / seconds, 3),
+            "images_per_s": round(images / seconds, 3),
+            "page_p50_ms": percentile_ms(page_seconds, 50),
+            "page_p99_ms": percentile_ms(page_seconds, 99),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": pdf.stats.report()["stages"],
+            "counters": pdf.stats.report()["counters"],
+        }
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def run_retriever_case(n_images: int, n_queries: int, stub: bool, index_type: str = "flat", topk: int = 10, seed: int = 0) -> dict:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from clip_faiss import MultiModalRetriever
+    folder = build_synthetic_folder(tempfile.mkdtemp(prefix="bench_retriever_"), n_images, seed=seed)
+    try:
+        # 關閉 query 快取，否則 search_batch 量到的是前面逐一搜尋時已經快取的 query
+        if stub:
+            r = MultiModalRetriever(text_model=StubEncoder(256), image_model=StubEncoder(512), index_type=index_type, query_cache_size=0)
+        else:
+            r = MultiModalRetriever(index_type=index_type, query_cache_size=0)
+        start = time.perf_counter()
+        r.add_folder(folder)
+        add_seconds = time.perf_counter() - start
+
+        rng = np.random.default_rng(seed + 1)
+        queries = ["".join(rng.choice(SYNTHETIC_WORDS, 3)) for _ in range(n_queries)]
+        r.search(queries[0], topk=topk) # warmup
+        query_seconds = []
+        start = time.perf_counter()
+        for q in queries:
+            t = time.perf_counter()
+            r.search(q, topk=topk)
+            query_seconds.append(time.perf_counter() - t)
+        seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        r.search_batch(queries, topk=topk)
+        batch_seconds = time.perf_counter() - start
+        return {
+            "images": n_images,
+            "queries": n_queries,
+            "add_seconds": round(add_seconds, 4),
+            "add_images_per_s": round(n_images / add_seconds, 3),
+            "queries_per_s": round(n_queries / seconds, 3),
+            "batch_queries_per_s": round(n_queries / batch_seconds, 3),
+            "query_p50_ms": percentile_ms(query_seconds, 50),
+            "query_p99_ms": percentile_ms(query_seconds, 99),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_isolated(fn, *args) -> dict:
+    """
+    在新的 process 中執行 fn，peak RSS 不會受到之前測試的影響
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+
+# ----------------------------
+# Report
+# ----------------------------
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.1) -> list:
+    """
+    回傳退步超過 threshold (比例) 的指標 [(case, metric, baseline, current), ...]
+    """
+    regressions = []
+    for case, metrics in current["cases"].items():
+        base = baseline.get("cases", {}).get(case)
+        if base is None:
+            continue
+        for metric, value in metrics.items():
+            old = base.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                continue
+            if metric in HIGHER_IS_BETTER and value < old * (1 - threshold):
+                regressions.append((case, metric, old, value))
+            elif metric in LOWER_IS_BETTER and value > old * (1 + threshold):
+                regressions.append((case, metric, old, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction and retrieval.")
+    parser.add_argument("--pdfs", nargs="*", default=None, help="PDF files (default: example_pdfs/*.pdf)")
+    parser.add_argument("--stub", action="store_true", help="replace layout/OCR/embedding models with fixed outputs")
+    parser.add_argument("--scale", type=int, nargs="*", default=[], help="also run on all PDFs concatenated N times")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--window", type=int, default=4)
+    parser.add_argument("--route", default="auto", choices=["auto", "layout", "native"])
+    parser.add_argument("--optimize-resolution", action="store_true")
+    parser.add_argument("--retriever-images", type=int, nargs="*", default=[1000, 10000], help="synthetic corpus sizes for the retriever")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--index-types", nargs="*", default=["flat"], choices=["flat", "hnsw", "ivf_flat", "ivf_pq"], help="retriever index types to compare")
+    parser.add_argument("--skip-extract", action="store_true")
+    parser.add_argument("--skip-retriever", action="store_true")
+    parser.add_argument("-o", "--output", default="benchmarks", help="directory for result JSON files")
+    parser.add_argument("--compare", default=None, help="previous result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    pdf_paths = args.pdfs or sorted(glob.glob(os.path.join(here, "example_pdfs", "*.pdf")))
+    result = {**environment(), "stub": args.stub, "cases": {}}
+    tmp_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        if not args.skip_extract:
+            cases = [(os.path.basename(p), p) for p in pdf_paths]
+            for scale in args.scale:
+                cases.append((f"all_x{scale}", build_scaled_pdf(pdf_paths, scale, os.path.join(tmp_dir, f"all_x{scale}.pdf"))))
+            for name, path in cases:
+                print(f"extract:{name} ...")
+                result["cases"][f"extract:{name}"] = run_isolated(run_extract_case, path, args.stub, args.dpi, args.window, args.route, args.optimize_resolution)
+        if not args.skip_retriever:
+            for index_type in args.index_types:
+                for n in args.retriever_images:
+                    name = f"retriever:{n}" if index_type == "flat" else f"retriever:{index_type}:{n}"
+                    print(f"{name} ...")
+                    result["cases"][name] = run_isolated(run_retriever_case, n, args.queries, args.stub, index_type)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    os.makedirs(args.output, exist_ok=True)
+    out_path = os.path.join(args.output, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    for case, m in result["cases"].items():
+        summary = ", ".join(f"{k}={m[k]}" for k in HIGHER_IS_BETTER + LOWER_IS_BETTER if k in m)
+        print(f"{case}: {summary}")
+    print(f"Results saved to {out_path}")
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        for case, metric, old, new in regressions:
+            print(f"[REGRESSION] {case} {metric}: {old} -> {new}")
+        if regressions:
+            return 1
+        print(f"No regression against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
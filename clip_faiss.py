@@ -1,8 +1,8 @@
-import os, json, re
+import os, json, re, math
+from collections import OrderedDict
 import numpy as np
-from PIL import Image
-import faiss
-from sentence_transformers import SentenceTransformer
+
+# faiss / sentence_transformers / PIL 都在第一次使用時才 import，import 這個模組不會載入模型
 
 
 # ----------------------------
@@ -33,6 +33,334 @@ def chunk_text(text, chunk_size=120, overlap=30):
     return chunks
 
 
+# ----------------------------
+# Index factory
+# ----------------------------
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+DEFAULT_INDEX_PARAMS = {
+    "hnsw_m": 32,             # HNSW 每個節點的連結數
+    "ef_construction": 200,
+    "ef_search": 64,          # search 時可用 ef_search 覆蓋
+    "nlist": None,            # IVF 的分群數，None 表示訓練時取 4 * sqrt(向量數)
+    "nprobe": 16,             # search 時可用 nprobe 覆蓋
+    "pq_m": 16,               # IVF-PQ 的子向量數 (會調整成維度的因數)
+    "pq_nbits": 8,
+    "min_train_per_list": 39, # 每個分群 (與 PQ 每個碼字) 至少需要的訓練向量數
+}
+
+
+def ivf_nlist(n: int, nlist=None) -> int:
+    if nlist:
+        return int(nlist)
+    return max(1, min(65536, int(4 * math.sqrt(max(n, 1)))))
+
+
+def train_size(index_type: str, n: int, params: dict) -> int:
+    """
+    index_type 在 n 個向量時需要的最少訓練向量數，不需要訓練的類型為 0
+    """
+    if index_type not in ("ivf_flat", "ivf_pq"):
+        return 0
+    need = ivf_nlist(n, params["nlist"]) * params["min_train_per_list"]
+    if index_type == "ivf_pq":
+        need = max(need, (1 << params["pq_nbits"]) * params["min_train_per_list"])
+    return need
+
+
+def make_index(index_type: str, dim: int, vectors: np.ndarray = None, params: dict = None):
+    """
+    建立 (並訓練) 內積相似度的 FAISS 索引，vectors 會一起加入索引
+    IVF 類型在向量數不足 train_size 時先使用 IndexFlatIP，之後由 MultiModalRetriever 在向量足夠時重建
+    """
+    import faiss
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index_type: {index_type}, expected one of {INDEX_TYPES}")
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    n = 0 if vectors is None else len(vectors)
+    if n < train_size(index_type, n, params):
+        index_type = "flat"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+    else:
+        nlist = ivf_nlist(n, params["nlist"])
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            pq_m = params["pq_m"]
+            while dim % pq_m:
+                pq_m -= 1
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, params["pq_nbits"], faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.nprobe = params["nprobe"]
+    if n:
+        index.add(vectors)
+    return index
+
+
+def pool_chunks(v_chunks: np.ndarray, offsets: np.ndarray, dim: int) -> np.ndarray:
+    """
+    每張圖片的 chunk 向量取平均 (沒有 chunk 的圖片為 0 向量)
+    v_chunks 為所有 chunk 連續存放的矩陣，第 i 張圖片的 chunk 為 v_chunks[offsets[i]:offsets[i+1]]
+    """
+    counts = np.diff(offsets)
+    pool = np.zeros((len(counts), dim), dtype="float32")
+    nonempty = counts > 0
+    if nonempty.any():
+        pool[nonempty] = np.add.reduceat(v_chunks, offsets[:-1][nonempty], axis=0) / counts[nonempty, None]
+    return pool
+
+
+def segment_max(scores: np.ndarray, starts: np.ndarray, counts: np.ndarray):
+    """
+    scores 依序由 len(counts) 段組成 (第 i 段從 starts[i] 開始，長度 counts[i])
+    回傳每段的最大值與其在段內的位置，空的段為 (0.0, -1)
+    """
+    seg_max = np.zeros(len(counts), dtype="float32")
+    seg_arg = np.full(len(counts), -1, dtype=np.int64)
+    nonempty = counts > 0
+    if not nonempty.any():
+        return seg_max, seg_arg
+    maxima = np.maximum.reduceat(scores, starts[nonempty])
+    seg_max[nonempty] = maxima
+    # 每段第一個等於最大值的位置
+    seg_id = np.repeat(np.flatnonzero(nonempty), counts[nonempty])
+    hits = np.flatnonzero(scores == np.repeat(maxima, counts[nonempty]))
+    first_seg, first = np.unique(seg_id[hits], return_index=True)
+    seg_arg[first_seg] = hits[first] - starts[first_seg]
+    return seg_max, seg_arg
+
+
+def is_trained_ann(index) -> bool:
+    """
+    index 是否已經是 IVF / HNSW (而不是還沒訓練前暫用的 IndexFlatIP)
+    """
+    import faiss
+    return faiss.try_extract_index_ivf(index) is not None or hasattr(index, "hnsw")
+
+
+def search_params(index, nprobe=None, ef_search=None):
+    """
+    單次搜尋用的 faiss SearchParameters，不會改動 index 本身 (多個呼叫端共用同一個索引時互不影響)
+    flat 索引或沒有需要覆蓋的參數時回傳 None
+    """
+    import faiss
+    if faiss.try_extract_index_ivf(index) is not None:
+        return None if nprobe is None else faiss.SearchParametersIVF(nprobe=nprobe)
+    if hasattr(index, "hnsw"):
+        return None if ef_search is None else faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def has_mmap_invlists(index) -> bool:
+    """
+    index 是否為以 IO_FLAG_MMAP 讀取的 IVF 索引 (inverted lists 為唯讀的 OnDiskInvertedLists)
+    """
+    import faiss
+    ivf = faiss.try_extract_index_ivf(index)
+    return ivf is not None and isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists)
+
+
+def load_invlists_to_memory(index):
+    """
+    將 mmap 的 inverted lists 複製成記憶體中的 ArrayInvertedLists (clone_index 不支援 OnDiskInvertedLists)
+    之後才能 add，write_index 也才會寫出資料本身而不是指向原檔案的參照
+    """
+    import faiss
+    ivf = faiss.extract_index_ivf(index)
+    src = ivf.invlists
+    dst = faiss.ArrayInvertedLists(src.nlist, src.code_size)
+    for l in range(src.nlist):
+        n = src.list_size(l)
+        if n:
+            dst.add_entries(l, n, src.get_ids(l), src.get_codes(l))
+    ivf.replace_invlists(dst, True)
+    dst.this.disown() # 由 ivf 負責釋放
+
+
+# ----------------------------
+# On-disk store
+# ----------------------------
+FORMAT_VERSION = 2 # 1: vectors.npz + meta.json (pickle)，2: .npy 矩陣 + offset 索引的文字檔 (可 mmap)
+
+
+def _replace_file(path: str, write):
+    """
+    先寫到暫存檔再取代，原本被 mmap 的檔案 (例如剛 load 的同一個資料庫) 不會被截斷
+    """
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _save_npy(path: str, array: np.ndarray):
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+    _replace_file(path, write)
+
+
+class TextBlob:
+    """
+    一連串 utf-8 字串存成一個 bytes 區塊加上 offsets，第 i 個字串為 data[offsets[i]:offsets[i+1]]
+    load 時以 mmap 開啟，只有被取用的字串才會讀進記憶體；新增的字串先放在 pending，save 時才寫入
+    """
+    def __init__(self, data=b"", offsets: np.ndarray = None):
+        self.data = data
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+        self._pending = []
+
+    def __len__(self):
+        return len(self.offsets) - 1 + len(self._pending)
+
+    def __getitem__(self, i: int) -> str:
+        n = len(self.offsets) - 1
+        if i < 0:
+            i += len(self)
+        if i >= n:
+            return self._pending[i - n]
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def extend(self, items):
+        self._pending.extend(items)
+
+    def save(self, data_path: str, offsets_path: str):
+        encoded = [t.encode("utf-8") for t in self._pending]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(lengths)])
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(memoryview(self.data)[:int(self.offsets[-1])])
+                for b in encoded:
+                    f.write(b)
+        _replace_file(data_path, write)
+        _save_npy(offsets_path, offsets)
+
+    @classmethod
+    def load(cls, data_path: str, offsets_path: str, mmap=True):
+        offsets = np.load(offsets_path, mmap_mode="r" if mmap else None)
+        if os.path.getsize(data_path) == 0:
+            data = b"" # 空檔案無法 mmap
+        elif mmap:
+            data = np.memmap(data_path, dtype=np.uint8, mode="r")
+        else:
+            with open(data_path, "rb") as f:
+                data = f.read()
+        return cls(data, offsets)
+
+
+class JsonBlob(TextBlob):
+    """
+    每一筆為一個 JSON 物件的 TextBlob，取用時才 parse
+    """
+    def __getitem__(self, i: int) -> dict:
+        n = len(self.offsets) - 1
+        if (i if i >= 0 else i + len(self)) >= n:
+            return super().__getitem__(i)
+        return json.loads(super().__getitem__(i))
+
+    def save(self, data_path: str, offsets_path: str):
+        items = self._pending
+        self._pending = [json.dumps(m, ensure_ascii=False) for m in items]
+        try:
+            super().save(data_path, offsets_path)
+        finally:
+            self._pending = items
+
+
+# ----------------------------
+# Query embedding cache
+# ----------------------------
+class QueryEmbeddingCache:
+    """
+    以 (模型名稱, 正規化後的 query) 為 key 的 LRU 快取，保存已經 normalize 的 query 向量
+    相同的 query 不需要再經過模型，save / load 不使用 pickle (json 文字 + 每個模型一個 .npy)
+    max_size 為向量數，同一個 query 在 text / image 模型各佔一筆
+    """
+    max_size: int
+    hits: int
+    misses: int
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # (model_name, text) -> np.ndarray
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, model_name: str, text: str):
+        vec = self._entries.get((model_name, text))
+        if vec is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((model_name, text))
+        self.hits += 1
+        return vec
+
+    def put(self, model_name: str, text: str, vec: np.ndarray):
+        # 複製一份: vec 通常是整批 encode 結果的一列，保留 view 會讓整個矩陣無法釋放
+        self._entries[(model_name, text)] = np.array(vec, dtype="float32")
+        self._entries.move_to_end((model_name, text))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def save(self, db_dir: str):
+        """
+        存成 {db_dir}/query_cache.json 與 query_cache_{i}.npy (依 LRU 順序，最舊的在前)
+        """
+        by_model = OrderedDict()
+        for (model_name, text), vec in self._entries.items():
+            by_model.setdefault(model_name, ([], []))
+            by_model[model_name][0].append(text)
+            by_model[model_name][1].append(vec)
+        models = []
+        for i, (model_name, (texts, vecs)) in enumerate(by_model.items()):
+            file_name = f"query_cache_{i}.npy"
+            np.save(os.path.join(db_dir, file_name), np.vstack(vecs).astype("float32"))
+            models.append({"model_name": model_name, "file": file_name, "texts": texts})
+        with open(os.path.join(db_dir, "query_cache.json"), "w", encoding="utf-8") as f:
+            json.dump({"max_size": self.max_size, "models": models}, f, ensure_ascii=False)
+
+    def load(self, db_dir: str) -> bool:
+        path = os.path.join(db_dir, "query_cache.json")
+        if not os.path.exists(path):
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for m in data["models"]:
+            vecs = np.load(os.path.join(db_dir, m["file"]))
+            for text, vec in zip(m["texts"], vecs):
+                self.put(m["model_name"], text, vec)
+        return True
+
+
 # ----------------------------
 # Retriever
 # ----------------------------
@@ -43,14 +371,25 @@ class MultiModalRetriever:
         self,
         text_model_name="google/embeddinggemma-300m",
         image_model_name="clip-ViT-B-32",
+        text_model=None,
+        image_model=None,
+        index_type="flat",
+        index_params=None,
+        query_cache_size=10000,
     ):
-        # models
+        # models (可以傳入已經載入的模型，或任何有相同 encode 介面的物件)
+        # 沒有傳入時第一次 encode 才載入
         self.text_model_name = text_model_name
         self.image_model_name = image_model_name
-        self.text_model = SentenceTransformer(text_model_name)
-        self.image_model = SentenceTransformer(image_model_name)
+        self._text_model = text_model
+        self._image_model = image_model
 
         # FAISS indices
+        # index_type: "flat" (暴力搜尋) / "hnsw" / "ivf_flat" / "ivf_pq"，見 make_index
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index_type: {index_type}, expected one of {INDEX_TYPES}")
+        self.index_type = index_type
+        self.index_params = {**DEFAULT_INDEX_PARAMS, **(index_params or {})}
         self.title_index = None     # text
         self.sur_index = None       # text (pooled, only for recall)
         self.img_index = None       # image
@@ -62,24 +401,87 @@ class MultiModalRetriever:
         # stored vectors
         self.v_title = None
         self.v_img = None
-        self.v_sur_chunks = []      # list[np.ndarray], per image (n_chunks, text_dim)
-        self.sur_chunks_text = []   # list[list[str]]
-
-        self.meta = []
+        self.v_sur_pool = None      # sur_index 中的向量 (每張圖片 chunks 的平均)，重建索引時使用
+        self.v_chunks = None        # 所有圖片的 chunk 向量連續存放 (n_chunks_total, text_dim)
+        self.chunk_offsets = np.zeros(1, dtype=np.int64) # 第 i 張圖片的 chunk 為 v_chunks[offsets[i]:offsets[i+1]]
+        self.chunk_texts = TextBlob() # 與 v_chunks 每一列對應的 chunk 文字
+
+        self.meta = JsonBlob()
+        self._mmap_invlists = False # load 時 IVF 索引的 inverted lists 以 mmap 唯讀開啟，新增資料或 save 前需要讀進記憶體
+
+        # query 向量的 LRU 快取，0 表示不快取
+        self.query_cache = QueryEmbeddingCache(query_cache_size) if query_cache_size > 0 else None
+
+    @property
+    def text_model(self):
+        if self._text_model is None:
+            from sentence_transformers import SentenceTransformer
+            self._text_model = SentenceTransformer(self.text_model_name)
+        return self._text_model
+
+    @text_model.setter
+    def text_model(self, model):
+        self._text_model = model
+
+    @property
+    def image_model(self):
+        if self._image_model is None:
+            from sentence_transformers import SentenceTransformer
+            self._image_model = SentenceTransformer(self.image_model_name)
+        return self._image_model
+
+    @image_model.setter
+    def image_model(self, model):
+        self._image_model = model
 
     # ----------------------------
     # Index init
     # ----------------------------
     def _ensure_index(self, text_dim: int, image_dim: int):
         if self.title_index is None:
-            self.title_index = faiss.IndexFlatIP(text_dim)
-            self.sur_index = faiss.IndexFlatIP(text_dim)
+            self.title_index = make_index(self.index_type, text_dim, params=self.index_params)
+            self.sur_index = make_index(self.index_type, text_dim, params=self.index_params)
             self.text_dim = text_dim
 
         if self.img_index is None:
-            self.img_index = faiss.IndexFlatIP(image_dim)
+            self.img_index = make_index(self.index_type, image_dim, params=self.index_params)
             self.image_dim = image_dim
 
+    def _ensure_writable(self):
+        if self._mmap_invlists:
+            for index in (self.title_index, self.sur_index, self.img_index):
+                if has_mmap_invlists(index):
+                    load_invlists_to_memory(index)
+            self._mmap_invlists = False
+
+    def _maybe_train(self):
+        """
+        IVF 類型的索引在向量數足夠訓練之前使用 IndexFlatIP，足夠之後以所有已儲存的向量重建
+        """
+        if self.index_type not in ("ivf_flat", "ivf_pq") or self.title_index is None:
+            return
+        if is_trained_ann(self.title_index):
+            return
+        n = self.title_index.ntotal
+        if n >= train_size(self.index_type, n, self.index_params):
+            self.rebuild_index()
+
+    def rebuild_index(self, index_type=None, **index_params):
+        """
+        以已儲存的向量重建三個索引，可以同時切換 index_type 或調整參數
+        """
+        if index_type is not None:
+            if index_type not in INDEX_TYPES:
+                raise ValueError(f"Unknown index_type: {index_type}, expected one of {INDEX_TYPES}")
+            self.index_type = index_type
+        self.index_params.update(index_params)
+        if self.v_title is None:
+            return
+        self.title_index = make_index(self.index_type, self.text_dim, self.v_title, self.index_params)
+        self.sur_index = make_index(self.index_type, self.text_dim, self.v_sur_pool, self.index_params)
+        self.img_index = make_index(self.index_type, self.image_dim, self.v_img, self.index_params)
+        self._mmap_invlists = False
+
     # ----------------------------
     # Add documents
     # ----------------------------
@@ -102,7 +504,7 @@ class MultiModalRetriever:
 
         for it in imgs:
             img_name = it["name"]
-            png_path = os.path.join(images_dir, f"{img_name}.png")
+            png_path = os.path.join(images_dir, it.get("file") or f"{img_name}.png")
             if not os.path.exists(png_path):
                 continue
 
@@ -129,6 +531,8 @@ class MultiModalRetriever:
                 "figure_title": fig_title,
                 "sur_text_list": sur_list,
                 "sur_chunks_used": sur_chunks,
+                # 去除重複後同一張圖片的所有出現位置 (沒有去重複時只有自己)
+                "occurrences": it.get("occurrences") or [{"page": it.get("page"), "coordinate": it.get("coordinate")}],
             })
 
         if not image_paths:
@@ -144,13 +548,8 @@ class MultiModalRetriever:
         ).astype("float32")
 
         # ---- text embeddings (surrounding chunks) ----
-        flat_chunks = []
-        chunk_ranges = []
-        cur = 0
-        for chunks in sur_chunks_text_list:
-            flat_chunks.extend(chunks)
-            chunk_ranges.append((cur, cur + len(chunks)))
-            cur += len(chunks)
+        flat_chunks = [c for chunks in sur_chunks_text_list for c in chunks]
+        chunk_offsets = np.concatenate([[0], np.cumsum([len(chunks) for chunks in sur_chunks_text_list])]).astype(np.int64)
 
         if flat_chunks:
             v_sur_all = self.text_model.encode(
@@ -164,6 +563,7 @@ class MultiModalRetriever:
             v_sur_all = None
 
         # ---- image embeddings ----
+        from PIL import Image
         pil_imgs = [Image.open(p).convert("RGB") for p in image_paths]
         v_img = self.image_model.encode(
             pil_imgs,
@@ -175,38 +575,30 @@ class MultiModalRetriever:
 
         # ---- ensure indices ----
         self._ensure_index(v_title.shape[1], v_img.shape[1])
+        self._ensure_writable()
 
         # ---- add to indices ----
         self.title_index.add(v_title)
         self.img_index.add(v_img)
 
         # pooled sur for recall (mean, only for candidate recall)
-        if v_sur_all is not None:
-            v_sur_pool = []
-            for a, b in chunk_ranges:
-                if a == b:
-                    v_sur_pool.append(np.zeros((self.text_dim,), dtype="float32"))
-                else:
-                    v_sur_pool.append(v_sur_all[a:b].mean(axis=0))
-            v_sur_pool = np.vstack(v_sur_pool)
-        else:
-            v_sur_pool = np.zeros((len(image_paths), self.text_dim), dtype="float32")
+        if v_sur_all is None:
+            v_sur_all = np.zeros((0, self.text_dim), dtype="float32")
+        v_sur_pool = pool_chunks(v_sur_all, chunk_offsets, self.text_dim)
 
         self.sur_index.add(v_sur_pool)
 
         # ---- store vectors ----
         self.v_title = v_title if self.v_title is None else np.vstack([self.v_title, v_title])
         self.v_img = v_img if self.v_img is None else np.vstack([self.v_img, v_img])
+        self.v_sur_pool = v_sur_pool if self.v_sur_pool is None else np.vstack([self.v_sur_pool, v_sur_pool])
 
-        for i, (a, b) in enumerate(chunk_ranges):
-            if v_sur_all is None or a == b:
-                self.v_sur_chunks.append(np.zeros((0, self.text_dim), dtype="float32"))
-                self.sur_chunks_text.append([])
-            else:
-                self.v_sur_chunks.append(v_sur_all[a:b])
-                self.sur_chunks_text.append(sur_chunks_text_list[i])
+        self.v_chunks = v_sur_all if self.v_chunks is None else np.vstack([self.v_chunks, v_sur_all])
+        self.chunk_offsets = np.concatenate([self.chunk_offsets, self.chunk_offsets[-1] + chunk_offsets[1:]])
+        self.chunk_texts.extend(flat_chunks)
 
         self.meta.extend(new_meta)
+        self._maybe_train()
         return len(new_meta)
 
     def add_folder(
@@ -246,9 +638,12 @@ class MultiModalRetriever:
 
         self.v_title = None
         self.v_img = None
-        self.v_sur_chunks = []
-        self.sur_chunks_text = []
-        self.meta = []
+        self.v_sur_pool = None
+        self.v_chunks = None
+        self.chunk_offsets = np.zeros(1, dtype=np.int64)
+        self.chunk_texts = TextBlob()
+        self.meta = JsonBlob()
+        self._mmap_invlists = False
 
         return self.add_document(json_path, images_dir, n_sur=n_sur)
 
@@ -263,67 +658,157 @@ class MultiModalRetriever:
         alpha=0.6,
         beta_title=0.7,
         beta_sur=0.3,
+        nprobe=None,
+        ef_search=None,
+    ):
+        """
+        nprobe: IVF 索引每次搜尋的分群數；ef_search: HNSW 搜尋時的候選數
+        (越大 recall 越高但越慢，None 表示使用 index_params 的設定)
+        """
+        return self.search_batch(
+            [query],
+            topk=topk,
+            k_each=k_each,
+            alpha=alpha,
+            beta_title=beta_title,
+            beta_sur=beta_sur,
+            nprobe=nprobe,
+            ef_search=ef_search,
+        )[0]
+
+    def search_batch(
+        self,
+        queries: list,
+        topk=10,
+        k_each=50,
+        alpha=0.6,
+        beta_title=0.7,
+        beta_sur=0.3,
+        nprobe=None,
+        ef_search=None,
+        batch_size=64,
     ):
+        """
+        一次搜尋多個 query，回傳與 queries 順序相同的 list，每個元素與 search 的回傳格式相同
+        所有 query 一起 encode，每個索引只做一次 FAISS search，
+        re-rank 時每 batch_size 個 query 一起計分
+        """
         if self.title_index is None:
             raise RuntimeError("Index not built")
+        if not queries:
+            return []
+        # 沒有指定時使用 index_params 的值，每次搜尋各自傳入參數
+        nprobe = self.index_params["nprobe"] if nprobe is None else nprobe
+        ef_search = self.index_params["ef_search"] if ef_search is None else ef_search
+        params = [search_params(index, nprobe=nprobe, ef_search=ef_search) for index in (self.title_index, self.sur_index, self.img_index)]
 
         # normalize weights
         s = beta_title + beta_sur
         beta_title /= s
         beta_sur /= s
 
-        # encode query
-        q_text = self.text_model.encode(
-            [query],
-            convert_to_numpy=True,
-            normalize_embeddings=True,
-        ).astype("float32")
-
-        q_img = self.image_model.encode(
-            [query],
-            convert_to_numpy=True,
-            normalize_embeddings=True,
-        ).astype("float32")
+        # encode queries
+        q_text, q_img = self._encode_queries(list(queries))
 
         # recall
-        _, It = self.title_index.search(q_text, k_each)
-        _, Is = self.sur_index.search(q_text, k_each)
-        _, Ii = self.img_index.search(q_img, k_each)
-
-        cand = set(It[0]) | set(Is[0]) | set(Ii[0])
+        _, It = self.title_index.search(q_text, k_each, params=params[0])
+        _, Is = self.sur_index.search(q_text, k_each, params=params[1])
+        _, Ii = self.img_index.search(q_img, k_each, params=params[2])
+        cands = np.concatenate([It, Is, Ii], axis=1)
 
         results = []
-        for idx in cand:
-            s_title = float(np.dot(q_text[0], self.v_title[idx]))
+        for b in range(0, len(queries), batch_size):
+            results.extend(self._rerank(
+                cands[b:b + batch_size], q_text[b:b + batch_size], q_img[b:b + batch_size],
+                topk, alpha, beta_title, beta_sur,
+            ))
+        return results
+
+    def _encode_queries(self, queries: list):
+        texts = [normalize_text(q) for q in queries]
+        q_text = self._encode_cached(self.text_model_name, lambda: self.text_model, texts)
+        q_img = self._encode_cached(self.image_model_name, lambda: self.image_model, texts)
+        return q_text, q_img
+
+    def _encode_cached(self, model_name: str, get_model, texts: list) -> np.ndarray:
+        """
+        只 encode 不在 query_cache 中的 query；全部命中時不會呼叫 (也不會載入) 模型
+        """
+        def encode(items):
+            return get_model().encode(
+                items,
+                batch_size=64,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            ).astype("float32")
 
-            v_chunks = self.v_sur_chunks[idx]
-            if v_chunks.shape[0] == 0:
-                s_sur = 0.0
-                best_chunk = None
-            else:
-                scores = v_chunks @ q_text[0]
-                best_i = int(np.argmax(scores))
-                s_sur = float(scores[best_i])
-                best_chunk = self.sur_chunks_text[idx][best_i]
-
-            s_img = float(np.dot(q_img[0], self.v_img[idx]))
-
-            s_text = beta_title * s_title + beta_sur * s_sur
-            score = alpha * s_text + (1 - alpha) * s_img
-
-            m = self.meta[idx]
-            results.append({
-                "score": score,
-                "s_text": s_text,
-                "s_title": s_title,
-                "s_sur": s_sur,
-                "s_img": s_img,
-                "best_sur_chunk": best_chunk,
-                **m,
-            })
+        if self.query_cache is None:
+            return encode(texts)
+        vecs = [self.query_cache.get(model_name, t) for t in texts]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vecs) if v is None))
+        if missing:
+            encoded = dict(zip(missing, encode(missing)))
+            for t, v in encoded.items():
+                self.query_cache.put(model_name, t, v)
+            vecs = [v if v is not None else encoded[t] for t, v in zip(texts, vecs)]
+        return np.vstack(vecs)
+
+    def _rerank(self, cands: np.ndarray, q_text: np.ndarray, q_img: np.ndarray, topk: int, alpha: float, beta_title: float, beta_sur: float) -> list:
+        """
+        cands: 每個 query 從三個索引召回的圖片 (n_queries, 3 * k_each)，-1 表示空位
+        對每一組 (query, 候選圖片) 計算 title / 最佳 chunk / 圖片分數，並取每個 query 的前 topk 名
+        只對實際出現的 (query, 候選) 組合計算內積 (einsum 逐列相乘)，不會建立 (候選 × query) 的完整矩陣
+        每組的 chunk 分數同樣逐列計算，再以 segment_max 取每組的最佳 chunk
+        """
+        # 每個 query 去除重複的候選，pairs 依 query 順序排列
+        C = np.sort(cands, axis=1)
+        keep = C >= 0 # 結果不足 k_each 時 FAISS 以 -1 補齊
+        keep[:, 1:] &= C[:, 1:] != C[:, :-1]
+        qid, col = np.nonzero(keep)
+        ids = C[qid, col]
+
+        s_title = np.einsum("ij,ij->i", self.v_title[ids], q_text[qid])
+        s_img = np.einsum("ij,ij->i", self.v_img[ids], q_img[qid])
+
+        # 每一組 (query, 候選) 的所有 chunk 依序排列
+        starts = self.chunk_offsets[ids]
+        counts = self.chunk_offsets[ids + 1] - starts
+        seg = np.cumsum(counts) - counts
+        rows = np.arange(counts.sum()) - np.repeat(seg - starts, counts)
+        chunk_scores = np.einsum("ij,ij->i", self.v_chunks[rows], q_text[np.repeat(qid, counts)])
+        s_sur, best = segment_max(chunk_scores, seg, counts)
+
+        s_text = beta_title * s_title + beta_sur * s_sur
+        score = alpha * s_text + (1 - alpha) * s_img
 
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:topk]
+        results = []
+        bounds = np.searchsorted(qid, np.arange(len(cands) + 1))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            if b - a > topk:
+                # 第 topk 名的分數有平手時，保留候選順序 (圖片 id) 較前面的，與完整的 stable sort 相同
+                neg = -score[a:b]
+                kth = np.partition(neg, topk - 1)[topk - 1]
+                better = np.flatnonzero(neg < kth)
+                ties = np.flatnonzero(neg == kth)[:topk - len(better)]
+                top = a + np.sort(np.concatenate([better, ties]))
+            else:
+                top = np.arange(a, b)
+            top = top[np.argsort(-score[top], kind="stable")]
+
+            hits = []
+            for j in top:
+                idx = int(ids[j])
+                hits.append({
+                    "score": float(score[j]),
+                    "s_text": float(s_text[j]),
+                    "s_title": float(s_title[j]),
+                    "s_sur": float(s_sur[j]),
+                    "s_img": float(s_img[j]),
+                    "best_sur_chunk": self.chunk_texts[int(self.chunk_offsets[idx] + best[j])] if best[j] >= 0 else None,
+                    **self.meta[idx],
+                })
+            results.append(hits)
+        return results
 
     # ----------------------------
     # Save/Load
@@ -333,11 +818,26 @@ class MultiModalRetriever:
         db_dir: str,
         text_model_name="google/embeddinggemma-300m",
         image_model_name="clip-ViT-B-32",
+        text_model=None,
+        image_model=None,
+        index_type=None,
+        index_params=None,
+        query_cache_size=10000,
+        mmap=True,
     ):
         """
         Load a saved MultiModalRetriever database and return a new instance.
+        Models are loaded lazily on the first query.
+        mmap: vectors, texts and the inverted lists of IVF indices are memory-mapped instead of read into RAM,
+              so processes serving the same DB share those pages through the OS page cache.
+              Flat and HNSW indices are always read into RAM (FAISS does not mmap them).
+              Mapped IVF lists are read-only; they are copied into RAM before the first add or save.
+        index_type / index_params: None keeps the saved index; otherwise the indices are rebuilt from the stored vectors.
+        A query cache saved with save(..., save_query_cache=True) is restored when present.
         """
+        import faiss
         
+        cfg = {}
         cfg_path = os.path.join(db_dir, "config.json")
         if os.path.exists(cfg_path):
             with open(cfg_path, "r", encoding="utf-8") as f:
@@ -347,81 +847,139 @@ class MultiModalRetriever:
             if cfg.get("image_model_name") != image_model_name:
                 print("[WARN] image_model_name does not match saved DB")
 
-        # 1️⃣ 建立新物件（model 會在 __init__ 初始化）
+        # 1️⃣ 建立新物件（model 會在第一次 encode 時載入）
         r = MultiModalRetriever(
             text_model_name=text_model_name,
             image_model_name=image_model_name,
+            text_model=text_model,
+            image_model=image_model,
+            index_type=cfg.get("index_type", "flat"),
+            index_params=cfg.get("index_params"),
+            query_cache_size=query_cache_size,
         )
+        if r.query_cache is not None:
+            r.query_cache.load(db_dir)
+
+        # 2️⃣ Load FAISS indices (mmap 只對 IVF 的 inverted lists 有效，flat / HNSW 仍會整個讀進記憶體)
+        for name in ("title", "sur", "img"):
+            path = os.path.join(db_dir, f"{name}.faiss")
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY) if mmap else faiss.read_index(path)
+            r._mmap_invlists |= has_mmap_invlists(index)
+            setattr(r, f"{name}_index", index)
+
+        # 3️⃣ Load vectors / texts / meta
+        if cfg.get("format_version", 1) >= 2:
+            r._load_arrays(db_dir, cfg, mmap)
+        else:
+            r._load_legacy(db_dir)
 
-        # 2️⃣ Load FAISS indices
-        r.title_index = faiss.read_index(os.path.join(db_dir, "title.faiss"))
-        r.sur_index   = faiss.read_index(os.path.join(db_dir, "sur.faiss"))
-        r.img_index   = faiss.read_index(os.path.join(db_dir, "img.faiss"))
+        if index_type is not None or index_params:
+            r.rebuild_index(index_type, **(index_params or {}))
 
-        # 3️⃣ Load vectors / dims
-        data = np.load(os.path.join(db_dir, "vectors.npz"), allow_pickle=True)
+        return r
 
-        r.v_title = data["v_title"]
-        r.v_img = data["v_img"]
-        r.v_sur_chunks = list(data["v_sur_chunks"])
-        r.sur_chunks_text = list(data["sur_chunks_text"])
+    def _load_arrays(self, db_dir: str, cfg: dict, mmap=True):
+        mode = "r" if mmap else None
+        self.text_dim = int(cfg["text_dim"])
+        self.image_dim = int(cfg["image_dim"])
+        self.v_title = np.load(os.path.join(db_dir, "v_title.npy"), mmap_mode=mode)
+        self.v_img = np.load(os.path.join(db_dir, "v_img.npy"), mmap_mode=mode)
+        self.v_sur_pool = np.load(os.path.join(db_dir, "v_sur_pool.npy"), mmap_mode=mode)
+        self.v_chunks = np.load(os.path.join(db_dir, "v_chunks.npy"), mmap_mode=mode)
+        self.chunk_offsets = np.load(os.path.join(db_dir, "chunk_offsets.npy"), mmap_mode=mode)
+        self.chunk_texts = TextBlob.load(os.path.join(db_dir, "chunk_texts.bin"), os.path.join(db_dir, "chunk_texts_offsets.npy"), mmap=mmap)
+        self.meta = JsonBlob.load(os.path.join(db_dir, "meta.bin"), os.path.join(db_dir, "meta_offsets.npy"), mmap=mmap)
+
+    def _load_legacy(self, db_dir: str):
+        """
+        舊版格式 (vectors.npz 中以 object array 存放 ragged 資料，需要 pickle)，只用於讀取舊的資料庫
+        再次 save 後會改存成新的格式
+        """
+        data = np.load(os.path.join(db_dir, "vectors.npz"), allow_pickle=True)
 
-        r.text_dim = int(data["text_dim"])
-        r.image_dim = int(data["image_dim"])
+        self.v_title = data["v_title"]
+        self.v_img = data["v_img"]
+        self.text_dim = int(data["text_dim"])
+        self.image_dim = int(data["image_dim"])
+        if "v_chunks" in data.files:
+            self.v_chunks = data["v_chunks"]
+            self.chunk_offsets = data["chunk_offsets"].astype(np.int64)
+        else:
+            # 每張圖片一個 chunk 陣列
+            v_sur_chunks = list(data["v_sur_chunks"])
+            self.chunk_offsets = np.concatenate([[0], np.cumsum([c.shape[0] for c in v_sur_chunks])]).astype(np.int64)
+            self.v_chunks = np.vstack(v_sur_chunks).astype("float32") if v_sur_chunks else np.zeros((0, self.text_dim), dtype="float32")
+        if "v_sur_pool" in data.files:
+            self.v_sur_pool = data["v_sur_pool"]
+        else:
+            # 沒有存 v_sur_pool，與 add_document 相同的方式重新計算
+            self.v_sur_pool = pool_chunks(self.v_chunks, self.chunk_offsets, self.text_dim)
+        self.chunk_texts = TextBlob()
+        self.chunk_texts.extend(t for chunks in data["sur_chunks_text"] for t in chunks)
 
-        # 4️⃣ Load meta
         with open(os.path.join(db_dir, "meta.json"), "r", encoding="utf-8") as f:
-            r.meta = json.load(f)
+            self.meta = JsonBlob()
+            self.meta.extend(json.load(f))
 
-        return r
-
-
-
-    def save(self, db_dir: str):
+    def save(self, db_dir: str, save_query_cache=False):
+        """
+        存成不需要 pickle、可以直接 mmap 的格式:
+            title.faiss / sur.faiss / img.faiss
+            v_title.npy, v_img.npy, v_sur_pool.npy, v_chunks.npy (float32) 與 chunk_offsets.npy
+            chunk_texts.bin + chunk_texts_offsets.npy, meta.bin + meta_offsets.npy (utf-8 / JSON，以 offset 取用)
+        save_query_cache: 一併保存 query 向量快取，下次 load 後熱門的 query 不需要再經過模型
+        """
+        import faiss
         os.makedirs(db_dir, exist_ok=True)
 
         # --- FAISS indices ---
-        faiss.write_index(self.title_index, os.path.join(db_dir, "title.faiss"))
-        faiss.write_index(self.sur_index,   os.path.join(db_dir, "sur.faiss"))
-        faiss.write_index(self.img_index,   os.path.join(db_dir, "img.faiss"))
+        # mmap 的 inverted lists 只會寫出指向原檔案的參照，而原檔案即將被取代
+        self._ensure_writable()
+        for name, index in (("title", self.title_index), ("sur", self.sur_index), ("img", self.img_index)):
+            _replace_file(os.path.join(db_dir, f"{name}.faiss"), lambda tmp_path, index=index: faiss.write_index(index, tmp_path))
 
         # --- vectors ---
-        np.savez_compressed(
-            os.path.join(db_dir, "vectors.npz"),
-            v_title=self.v_title,
-            v_img=self.v_img,
-            v_sur_chunks=np.array(self.v_sur_chunks, dtype=object),
-            sur_chunks_text=np.array(self.sur_chunks_text, dtype=object),
-            text_dim=self.text_dim,
-            image_dim=self.image_dim,
-        )
+        _save_npy(os.path.join(db_dir, "v_title.npy"), self.v_title)
+        _save_npy(os.path.join(db_dir, "v_img.npy"), self.v_img)
+        _save_npy(os.path.join(db_dir, "v_sur_pool.npy"), self.v_sur_pool)
+        _save_npy(os.path.join(db_dir, "v_chunks.npy"), self.v_chunks)
+        _save_npy(os.path.join(db_dir, "chunk_offsets.npy"), self.chunk_offsets)
+
+        # --- texts / meta ---
+        self.chunk_texts.save(os.path.join(db_dir, "chunk_texts.bin"), os.path.join(db_dir, "chunk_texts_offsets.npy"))
+        self.meta.save(os.path.join(db_dir, "meta.bin"), os.path.join(db_dir, "meta_offsets.npy"))
 
-        # --- meta ---
-        with open(os.path.join(db_dir, "meta.json"), "w", encoding="utf-8") as f:
-            json.dump(self.meta, f, ensure_ascii=False, indent=2)
-            
         with open(os.path.join(db_dir, "config.json"), "w", encoding="utf-8") as f:
             json.dump({
+                "format_version": FORMAT_VERSION,
                 "text_model_name": self.text_model_name or "",
                 "image_model_name": self.image_model_name or "",
+                "text_dim": self.text_dim,
+                "image_dim": self.image_dim,
+                "index_type": self.index_type,
+                "index_params": self.index_params,
             }, f, indent=2)
 
+        if save_query_cache and self.query_cache is not None:
+            self.query_cache.save(db_dir)
+
 
 # ===== 用法 =====
-# r = MultiModalRetriever()
-# r.add_folder("output_stored/L1Vin1RByA/image_datas", n_sur=3)
-# r.add_folder("output_stored/43Uk9N1gnY/image_datas", n_sur=3)
-r = MultiModalRetriever.load("db")
-
-hits = r.search(
-    "香菇甘草種植",
-    topk=3,
-    alpha=0.7,        # text 60%, image 40%
-    beta_title=0.7,   # text 裡面：title 80%
-    beta_sur=0.3
-)
-
-open("o.json", "w", encoding="utf-8").write(json.dumps(hits, ensure_ascii=False, indent=2))
-
-# r.save("db")
+if __name__ == "__main__":
+    # r = MultiModalRetriever()
+    # r.add_folder("output_stored/L1Vin1RByA/image_datas", n_sur=3)
+    # r.add_folder("output_stored/43Uk9N1gnY/image_datas", n_sur=3)
+    r = MultiModalRetriever.load("db")
+
+    hits = r.search(
+        "香菇甘草種植",
+        topk=3,
+        alpha=0.7,        # text 60%, image 40%
+        beta_title=0.7,   # text 裡面：title 80%
+        beta_sur=0.3
+    )
+
+    open("o.json", "w", encoding="utf-8").write(json.dumps(hits, ensure_ascii=False, indent=2))
+
+    # r.save("db")
 
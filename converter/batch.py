@@ -0,0 +1,232 @@
+"""
+批次處理整個資料夾 (或檔案清單) 的 PDF，並以 manifest 記錄每份文件的處理狀態
+
+用法:
+    python -m converter.batch example_pdfs/ -o output/batch -w 4
+    python -m converter.batch --list pdfs.txt -o output/batch
+
+中斷後重新執行相同指令，manifest 中狀態為 done 的文件會被略過
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import model_pool
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+def collect_pdfs(inputs: list, list_file: str = None) -> list:
+    """
+    將輸入的資料夾 / 檔案 / 清單檔展開成排序後的 PDF 路徑清單
+    """
+    paths = []
+    if list_file is not None:
+        with open(list_file, "r", encoding="utf-8") as f:
+            paths.extend(line.strip() for line in f if line.strip())
+    for p in inputs:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                for name in files:
+                    if name.lower().endswith(".pdf"):
+                        paths.append(os.path.join(root, name))
+        else:
+            paths.append(p)
+    # 去除重複並固定順序
+    return sorted(set(os.path.abspath(p) for p in paths))
+
+
+def output_dir_for(pdf_path: str, output_root: str) -> str:
+    """
+    每份文件固定的輸出位置: {output_root}/{檔名}_{路徑雜湊}，重新執行時位置不變
+    """
+    name = os.path.splitext(os.path.basename(pdf_path))[0]
+    digest = hashlib.sha1(pdf_path.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(output_root, f"{name}_{digest}")
+
+
+class Manifest:
+    """
+    以 JSON 檔記錄每份文件的狀態、耗時與輸出位置，每次更新都會整份寫回 (先寫暫存檔再取代)
+    """
+    path: str
+    docs: dict
+
+    def __init__(self, path: str):
+        self.path = path
+        self.docs = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.docs = json.load(f).get("docs", {})
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # 不完整的 manifest (例如複製到一半) 視為沒有紀錄，所有文件都會重新處理
+                print(f"[WARN] manifest {path} is corrupted, starting from scratch")
+                self.docs = {}
+
+    def is_done(self, pdf_path: str) -> bool:
+        d = self.docs.get(pdf_path)
+        if d is None or d.get("status") != STATUS_DONE:
+            return False
+        return os.path.exists(os.path.join(d["output"], "metadata.json"))
+
+    def update(self, pdf_path: str, **fields):
+        self.docs.setdefault(pdf_path, {}).update(fields)
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"docs": self.docs}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+_result_caches = {} # cache_dir -> ResultCache，同一個 process 處理的所有文件共用
+
+
+def get_result_cache(cache_dir: str):
+    """
+    每個 process 對同一個 cache_dir 只建立一次 ResultCache
+    """
+    if cache_dir is None:
+        return None
+    cache = _result_caches.get(cache_dir)
+    if cache is None:
+        from .result_cache import ResultCache
+        cache = _result_caches[cache_dir] = ResultCache(cache_dir)
+    return cache
+
+
+def init_worker(gpu=False, cache_dir: str = None):
+    """
+    worker process 的 initializer: 載入模型並建立共用的 ResultCache
+    """
+    model_pool.warmup(gpu)
+    get_result_cache(cache_dir)
+
+
+def process_pdf(pdf_path: str, output: str, gpu=False, stream=False, window=4, cache_dir: str = None, dedupe=False, image_format="png", passthrough=False, profile_backend: str = None) -> dict:
+    """
+    處理單一份 PDF，回傳要寫入 manifest 的欄位
+    """
+    start = time.perf_counter()
+    try:
+        # 在 worker 中才載入 fitz / cv2 / numpy 等套件，CLI 本身可以很快啟動
+        from .pdf_info import PdfInfo
+        pdf = PdfInfo(pdf_path, gpu=gpu, cache=get_result_cache(cache_dir), image_format=image_format, image_passthrough=passthrough)
+        pages = len(pdf.pdf_doc)
+        pdf.export_all_images_and_image_descriptions(stream=stream, window=window, path=output, dedupe=dedupe, profile_backend=profile_backend)
+        with open(os.path.join(output, "metadata.json"), "r", encoding="utf-8") as f:
+            images = len(json.load(f)["imgs"])
+        del pdf
+        return {
+            "status": STATUS_DONE,
+            "pages": pages,
+            "images": images,
+            "seconds": round(time.perf_counter() - start, 3),
+            "error": None,
+        }
+    except Exception:
+        return {
+            "status": STATUS_FAILED,
+            "seconds": round(time.perf_counter() - start, 3),
+            "error": traceback.format_exc(),
+        }
+
+
+def run(pdf_paths: list, output_root: str, manifest_path: str = None, workers: int = 1, gpu=False, stream=False, window=4, retry_failed=True, cache_dir: str = None, dedupe=False, image_format="png", passthrough=False, profile_backend: str = None) -> Manifest:
+    """
+    依序 (或以多個 process) 處理 pdf_paths，已經完成的文件會被略過
+    """
+    if manifest_path is None:
+        manifest_path = os.path.join(output_root, "manifest.json")
+    manifest = Manifest(manifest_path)
+
+    todo = []
+    for pdf_path in pdf_paths:
+        if manifest.is_done(pdf_path):
+            continue
+        if not retry_failed and manifest.docs.get(pdf_path, {}).get("status") == STATUS_FAILED:
+            continue
+        todo.append(pdf_path)
+        manifest.docs.setdefault(pdf_path, {}).update({
+            "status": STATUS_PENDING,
+            "output": output_dir_for(pdf_path, output_root),
+        })
+    manifest.save()
+    print(f"{len(pdf_paths) - len(todo)} documents already done, {len(todo)} to process")
+
+    if workers <= 1:
+        init_worker(gpu, cache_dir)
+        for i, pdf_path in enumerate(todo):
+            print(f"[{i+1}/{len(todo)}] {pdf_path}")
+            manifest.update(pdf_path, status=STATUS_RUNNING, started_at=time.time())
+            result = process_pdf(pdf_path, manifest.docs[pdf_path]["output"], gpu=gpu, stream=stream, window=window, cache_dir=cache_dir, dedupe=dedupe, image_format=image_format, passthrough=passthrough, profile_backend=profile_backend)
+            manifest.update(pdf_path, finished_at=time.time(), **result)
+        return manifest
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(gpu, cache_dir)) as executor:
+        futures = {}
+        for pdf_path in todo:
+            manifest.docs[pdf_path].update(status=STATUS_RUNNING, started_at=time.time())
+            futures[executor.submit(process_pdf, pdf_path, manifest.docs[pdf_path]["output"], gpu, stream, window, cache_dir, dedupe, image_format, passthrough, profile_backend)] = pdf_path
+        manifest.save()
+        for i, future in enumerate(as_completed(futures)):
+            pdf_path = futures[future]
+            result = future.result()
+            print(f"[{i+1}/{len(todo)}] {result['status']}: {pdf_path}")
+            manifest.update(pdf_path, finished_at=time.time(), **result)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch extract images and descriptions from PDFs.")
+    parser.add_argument("inputs", nargs="*", help="PDF files or directories")
+    parser.add_argument("--list", dest="list_file", help="text file with one PDF path per line")
+    parser.add_argument("-o", "--output", default="output/batch", help="output root directory")
+    parser.add_argument("-m", "--manifest", default=None, help="manifest path (default: {output}/manifest.json)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--gpu", action="store_true")
+    parser.add_argument("--stream", action="store_true", help="use the page-by-page streaming pipeline")
+    parser.add_argument("--window", type=int, default=4, help="pages per streaming window")
+    parser.add_argument("--cache-dir", default=None, help="reuse layout/OCR results cached by page content")
+    parser.add_argument("--dedupe", action="store_true", help="store repeated images (logos, headers) only once")
+    parser.add_argument("--image-format", default="png", choices=["png", "jpeg", "webp"], help="format for re-encoded images")
+    parser.add_argument("--passthrough", action="store_true", help="write embedded JPEG/JPX/PNG streams without re-encoding")
+    parser.add_argument("--profile", default=None, choices=["cprofile", "pyinstrument"], help="write a profile of each document next to metadata.json")
+    parser.add_argument("--skip-failed", action="store_true", help="do not retry documents that failed before")
+    args = parser.parse_args(argv)
+
+    pdf_paths = collect_pdfs(args.inputs, args.list_file)
+    if not pdf_paths:
+        parser.error("no PDF found")
+    manifest = run(
+        pdf_paths,
+        args.output,
+        manifest_path=args.manifest,
+        workers=args.workers,
+        gpu=args.gpu,
+        stream=args.stream,
+        window=args.window,
+        retry_failed=not args.skip_failed,
+        cache_dir=args.cache_dir,
+        dedupe=args.dedupe,
+        image_format=args.image_format,
+        passthrough=args.passthrough,
+        profile_backend=args.profile,
+    )
+    failed = [p for p, d in manifest.docs.items() if d.get("status") == STATUS_FAILED]
+    print(f"Done. {len(failed)} failed. Manifest: {manifest.path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,51 @@
+from .tools.image_hash import dhash, hamming_distance
+
+
+class ImageDeduplicator:
+    """
+    匯出時找出重複的圖片 (例如每頁都出現的 logo、頁首、浮水印)
+    判斷順序:
+        1. 同一個 xref
+        2. 相同的內容雜湊 (sha256)
+        3. (選用) 渲染擷取的圖片使用 perceptual hash，漢明距離 <= phash_threshold 視為相同
+    """
+    use_phash: bool
+    phash_threshold: int
+
+    def __init__(self, use_phash=False, phash_threshold=4):
+        self.use_phash = use_phash
+        self.phash_threshold = phash_threshold
+        self.by_xref = {}
+        self.by_sha256 = {}
+        self.by_phash = [] # [(phash, entry), ...]
+
+    def find(self, xref: int = None, sha256: str = None, phash: int = None):
+        """
+        回傳已經匯出過的相同圖片的 metadata 項目，沒有則回傳 None
+        """
+        if xref is not None and xref in self.by_xref:
+            return self.by_xref[xref]
+        if sha256 is not None and sha256 in self.by_sha256:
+            return self.by_sha256[sha256]
+        if phash is not None:
+            for h, entry in self.by_phash:
+                if hamming_distance(h, phash) <= self.phash_threshold:
+                    return entry
+        return None
+
+    def add(self, entry: dict, xref: int = None, sha256: str = None, phash: int = None):
+        if xref is not None:
+            self.by_xref[xref] = entry
+        if sha256 is not None:
+            self.by_sha256[sha256] = entry
+        if phash is not None:
+            self.by_phash.append((phash, entry))
+
+    def image_keys(self, img_data) -> dict:
+        """
+        計算 img_data 用來比對的 key (xref / sha256 / phash)
+        """
+        keys = {"xref": img_data.xref, "sha256": img_data.content_hash(), "phash": None}
+        if self.use_phash and img_data.xref is None:
+            keys["phash"] = dhash(img_data.image)
+        return keys
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 def normalize_box(box):
     return [float(v) for v in box]
@@ -45,3 +46,47 @@ def box_distance(box1: list, box2: list, type="avg"):
 
     else:
         raise ValueError(f"Unknown distance type: {type}")
+
+
+# ----- 向量化版本: 一次計算多個 box 之間的距離 -----
+BOX_DTYPE = np.dtype([("label", "U32"), ("coordinate", "f8", (4,))])
+
+def page_box_array(page_boxes: list) -> np.ndarray:
+    """
+    將 Layout 的 boxes 轉成 structured array，欄位為 label 與 coordinate [x1, y1, x2, y2]
+    """
+    arr = np.empty(len(page_boxes), dtype=BOX_DTYPE)
+    for i, box in enumerate(page_boxes):
+        arr[i] = (box["label"], normalize_box(box["coordinate"]))
+    return arr
+
+def pairwise_box_distance(boxes1: np.ndarray, boxes2: np.ndarray, type="avg") -> np.ndarray:
+    """
+    boxes1: (N, 4)，boxes2: (M, 4)
+    回傳 (N, M) 的距離矩陣，每一格與 box_distance(boxes1[i], boxes2[j], type) 相同
+    """
+    b1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)[:, None, :]
+    b2 = np.asarray(boxes2, dtype=np.float64).reshape(-1, 4)[None, :, :]
+    x1_min, y1_min, x1_max, y1_max = b1[..., 0], b1[..., 1], b1[..., 2], b1[..., 3]
+    x2_min, y2_min, x2_max, y2_max = b2[..., 0], b2[..., 1], b2[..., 2], b2[..., 3]
+
+    if type == "avg":
+        dx = (x1_min + x1_max) / 2 - (x2_min + x2_max) / 2
+        dy = (y1_min + y1_max) / 2 - (y2_min + y2_max) / 2
+        return np.hypot(dx, dy)
+
+    elif type == "min":
+        dx = np.maximum(np.maximum(x2_min - x1_max, x1_min - x2_max), 0)
+        dy = np.maximum(np.maximum(y2_min - y1_max, y1_min - y2_max), 0)
+        return np.hypot(dx, dy)
+
+    elif type == "max":
+        # 16 組角點中 x 與 y 的選擇互相獨立，因此最遠距離 = hypot(最大的 |dx|, 最大的 |dy|)
+        dx = np.maximum(np.abs(x1_max - x2_min), np.abs(x2_max - x1_min))
+        dx = np.maximum(dx, np.maximum(np.abs(x1_min - x2_min), np.abs(x1_max - x2_max)))
+        dy = np.maximum(np.abs(y1_max - y2_min), np.abs(y2_max - y1_min))
+        dy = np.maximum(dy, np.maximum(np.abs(y1_min - y2_min), np.abs(y1_max - y2_max)))
+        return np.hypot(dx, dy)
+
+    else:
+        raise ValueError(f"Unknown distance type: {type}")
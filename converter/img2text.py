@@ -1,34 +1,32 @@
 import numpy as np
-from PIL import Image
-from paddleocr import PaddleOCR
+
+from .model_pool import OcrEngine, get_ocr_engine
+from .result_cache import ResultCache, ocr_key
+
+def join_rec_texts(rec_texts: list, nl=False) -> str:
+    text = ""
+    for v in rec_texts:
+        text += v
+        if nl:
+            text += "\n"
+    return text
 
 class ImgOcr:
     raw_image: np.ndarray
     extracted_text: str
     result = None
-    def __init__(self, imgInput: np.ndarray, nl=False, gpu=False):
-        if gpu:
-            ocr = PaddleOCR(
-                text_detection_model_name="PP-OCRv5_server_det",
-                text_recognition_model_name="PP-OCRv5_server_rec",
-                use_doc_orientation_classify=False,
-                use_doc_unwarping=False,
-                use_textline_orientation=False,
-                device="gpu"
-            )
-        else:
-            ocr = PaddleOCR(
-                text_detection_model_name="PP-OCRv5_server_det",
-                text_recognition_model_name="PP-OCRv5_server_rec",
-                use_doc_orientation_classify=False,
-                use_doc_unwarping=False,
-                use_textline_orientation=False,
-            )
-        res = ocr.predict(imgInput)
-        self.result = res
-        self.extracted_text = ""
-        for v in res[0]["rec_texts"]:
-            self.extracted_text += v
-            if nl:
-                self.extracted_text += "\n"
-        self.raw_image = imgInput
\ No newline at end of file
+    def __init__(self, imgInput: np.ndarray, nl=False, gpu=False, engine: OcrEngine = None, cache: ResultCache = None):
+        if engine is None:
+            engine = get_ocr_engine(gpu)
+        rec_texts = None
+        if cache is not None:
+            key = ocr_key(imgInput, engine.det_model, engine.rec_model)
+            rec_texts = cache.get(key)
+        if rec_texts is None:
+            res = engine.predict(imgInput)
+            self.result = res
+            rec_texts = list(res[0]["rec_texts"])
+            if cache is not None:
+                cache.put(key, rec_texts)
+        self.extracted_text = join_rec_texts(rec_texts, nl=nl)
+        self.raw_image = imgInput
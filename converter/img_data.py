@@ -1,21 +1,28 @@
+import hashlib
+import io
 import numpy as np
 from PIL import Image
 import fitz
 import os
 
-from .distance import box_distance, normalize_box
+from .distance import normalize_box, page_box_array, pairwise_box_distance
 from .img2text import ImgOcr
+from .model_pool import OcrEngine, get_ocr_engine
+from .result_cache import ResultCache, array_digest
+from .text_layer import PageTextIndex
 from .tools.coordinates import map_bbox
 from .tools.text_validation import is_garbled_text
 from .tools import random_uid
 
 class ImgData:
     uid: str
-    store_path = "tmp/ImgData"
     coordinate: list
     image_diagonal_length: float
     raw_pdf_path: str # 原始的 PDF 文件所在位置，提取圖片周圍文字時會使用到
     img_page: int # 使用 pdf 解析功能時，需要知道圖片所在的頁數
+    xref: int = None # 圖片若是直接從 pdf 內嵌圖片取得，記錄其 xref (用於去除重複圖片)
+    raw_bytes: bytes = None # 內嵌圖片的原始編碼資料 (JPEG / JPX / PNG ...)
+    raw_ext: str = None # 原始編碼資料的格式 (extract_image 的 ext)
     
     image_has_figure_title: bool
     image_figure_title_box: dict
@@ -25,14 +32,18 @@ class ImgData:
     image_surrounding_texts: list
     
     use_gpu = False
+    ocr_engine: OcrEngine = None
+    result_cache: ResultCache = None # 若有設定，OCR 結果會以裁切區塊的雜湊快取
     
-    def __init__(self, image: np.ndarray, page_boxes: list, image_box_index: int, figure_title_threshold: float = 0.05, gpu=False):
+    def __init__(self, image: np.ndarray, page_boxes: list, image_box_index: int, figure_title_threshold: float = 0.05, gpu=False, ocr_engine: OcrEngine = None, box_array: np.ndarray = None, distances: np.ndarray = None):
         """_summary_
 
         Args:
             image (np.ndarray): 輸入的圖像 (numpy array) (通常為完整的頁面)
             page_boxes (list): 其他 Layout 元素的座標位置 [x1, y1, x2, y2]
             image_box_index (int): 圖片的 box index
+            box_array (np.ndarray): page_box_array(page_boxes) 的結果，同一頁的圖片可以共用
+            distances (np.ndarray): 圖片到每個 box 的 "min" 距離，同一頁可用 pairwise_box_distance 一次算好
         
         Description: 
             功能: 找出圖片本身以及圖片的標題或提示字
@@ -43,13 +54,10 @@ class ImgData:
         image_coordinate = normalize_box(page_boxes[image_box_index]['coordinate'])
         self.uid = random_uid.generate()
         
-        # 將圖片透過座標方框擷取出來並暫存
+        # 將圖片透過座標方框擷取出來 (只保留 view，匯出時才編碼)
         x1, y1, x2, y2 = map(int, image_coordinate)
-        self.store_path = os.path.join(self.store_path, self.uid)
-        os.makedirs(self.store_path, exist_ok=True)
-        self.store_path = os.path.join(self.store_path, "image.png")
-        image = image[y1:y2, x1:x2]
-        Image.fromarray(image).save(self.store_path)
+        self._image = image[y1:y2, x1:x2]
+        self._decode = None
         
         self.image_diagonal_length = np.linalg.norm(
             np.array(image_coordinate[2:]) - np.array(image_coordinate[:2])
@@ -60,47 +68,77 @@ class ImgData:
         self.coordinate = image_coordinate
         
         self.use_gpu = gpu
+        self.ocr_engine = ocr_engine if ocr_engine is not None else get_ocr_engine(gpu)
         
         # 偵測圖片周圍的可用 boxes
-        min_figure_title_distance = self.image_diagonal_length * figure_title_threshold
-        min_figure_title: dict = None
-        text_distances = []
-        for box in page_boxes:
-            d = box_distance(image_coordinate, box['coordinate'], type="min")
-            if box["label"] == "figure_title":
-                if d < min_figure_title_distance:
-                    min_figure_title = box
-                    min_figure_title_distance = d
-            elif box["label"] == "text":
-                text_distances.append((box, d))
+        if box_array is None:
+            box_array = page_box_array(page_boxes)
+        if distances is None:
+            distances = pairwise_box_distance([image_coordinate], box_array["coordinate"], type="min")[0]
+        labels = box_array["label"]
         
-        if min_figure_title is not None:
+        # figure_title: 距離小於門檻中最近的一個
+        min_figure_title_distance = self.image_diagonal_length * figure_title_threshold
+        title_idx = np.flatnonzero((labels == "figure_title") & (distances < min_figure_title_distance))
+        if title_idx.size > 0:
             self.image_has_figure_title = True
-            self.image_figure_title_box = min_figure_title
+            self.image_figure_title_box = page_boxes[title_idx[np.argmin(distances[title_idx])]]
         
-        text_distances.sort(key=lambda x: x[1])
-        for box, d in text_distances[:3]:
-            self.image_surrounding_text_boxes.append(box)
+        # text: 最近的 3 個，距離相同時保留 page_boxes 中的順序 (與原本的 stable sort 相同)
+        text_idx = np.flatnonzero(labels == "text")
+        text_idx = text_idx[np.argsort(distances[text_idx], kind="stable")[:3]]
+        for i in text_idx:
+            self.image_surrounding_text_boxes.append(page_boxes[i])
+    
+    @property
+    def image(self) -> np.ndarray:
+        """
+        圖片本體 (通常是頁面陣列的 view，不會複製也不會寫入暫存檔)
+        若目前只有原始編碼資料，第一次存取時才解碼
+        """
+        if self._image is None and self.raw_bytes is not None:
+            if self._decode is not None:
+                self._image = self._decode()
+            else:
+                self._image = np.asarray(Image.open(io.BytesIO(self.raw_bytes)).convert("RGB"))
+        return self._image
     
     def update_image(self, image: np.ndarray):
         """
         更新物件所儲存的圖片本體 (圖片本體不會再被使用到，因此可以被更新)
-        輸入: 純圖片的 numpy 陣列
-        動作: 更新儲存於暫存區的圖片檔案
+        輸入: 純圖片的 numpy 陣列 (直接保留，不會複製)
+        """
+        self._image = image
+        self.raw_bytes = None
+        self.raw_ext = None
+        self._decode = None
+    
+    def set_raw_image(self, data: bytes, ext: str, decode=None):
+        """
+        以內嵌圖片的原始編碼資料取代圖片本體，需要像素時才會解碼
+        decode: 可選的解碼函式 (回傳 RGB 陣列)，例如 PdfInfo.decode_xref 會從快取的原始資料解碼，不必重新提取
         """
-        Image.fromarray(image).save(self.store_path)
+        self._image = None
+        self.raw_bytes = data
+        self.raw_ext = ext
+        self._decode = decode
             
-    def get_surroundings(self, raw_image: np.ndarray, nl=False):
+    def collect_surroundings(self, raw_image: np.ndarray, nl=False, text_index: PageTextIndex = None) -> list:
         """
-        功能: 從 __init__ 中提取出的 text box 以及 figure_title box 去 OCR 出文字
+        功能: 先嘗試直接從 pdf 文字層提取 figure_title 以及 text box 的文字
+        text_index: 該頁的 PageTextIndex (由 PdfInfo 提供)，若沒有提供則自行開啟 raw pdf 建立
+        回傳: 提取失敗 (亂碼或空白) 需要 OCR 的區塊 [(slot, 裁切圖片, nl), ...]，OCR 完成後交給 fill_ocr_text 寫回
         """
-        # 取得 raw pdf
-        doc = fitz.open(self.raw_pdf_path)
-        page = doc[self.img_page]
-        raw_width = page.rect.width
-        raw_height = page.rect.height
+        if text_index is None:
+            # 取得 raw pdf
+            doc = fitz.open(self.raw_pdf_path)
+            text_index = PageTextIndex(doc[self.img_page])
+            doc.close()
+        raw_width = text_index.page_width
+        raw_height = text_index.page_height
         (img_height, img_width) = raw_image.shape[:2]
         # print(f"raw_width={raw_width}, raw_height={raw_height}, img_width={img_width}, img_height={img_height}")
+        pending = []
         
         # figure_title 部分
         if self.image_has_figure_title:
@@ -108,35 +146,83 @@ class ImgData:
             # 嘗試直接提取自元
             (x1_t, y1_t, x2_t, y2_t) = map_bbox(x1, y1, x2, y2, img_width, img_height, raw_width, raw_height)
             rect = fitz.Rect(int(x1_t), int(y1_t), int(x2_t), int(y2_t))
-            text = page.get_text("text", clip=rect)
+            text = text_index.get_text(rect)
             if is_garbled_text(text) or len(text) == 0:
-                ocr = ImgOcr(raw_image[y1:y2, x1:x2], gpu=self.use_gpu, nl=False)
-                self.image_figure_title_text = ocr.extracted_text
+                self.image_figure_title_text = ""
+                pending.append((("figure_title", None), raw_image[y1:y2, x1:x2], False))
             else:
                 text = text.replace("\n", "")
                 self.image_figure_title_text = text
         # text boxes 部分
         self.image_surrounding_texts = []
-        for box in self.image_surrounding_text_boxes:
+        for i, box in enumerate(self.image_surrounding_text_boxes):
             x1, y1, x2, y2 = map(int, box['coordinate'])
             # 嘗試直接提取自元
             (x1_t, y1_t, x2_t, y2_t) = map_bbox(x1, y1, x2, y2, img_width, img_height, raw_width, raw_height)
             # print(f"Extract words from ({x1_t}, {y1_t}, {x2_t}, {y2_t}) at page {self.img_page+1}, image coordinates=({x1}, {y1}, {x2}, {y2})")
             rect = fitz.Rect(int(x1_t), int(y1_t), int(x2_t), int(y2_t))
-            text = page.get_text("text", clip=rect)
+            text = text_index.get_text(rect)
             if is_garbled_text(text) or len(text) == 0:
-                ocr = ImgOcr(raw_image[y1:y2, x1:x2], gpu=self.use_gpu, nl=nl)
-                self.image_surrounding_texts.append(ocr.extracted_text)
+                self.image_surrounding_texts.append("")
+                pending.append((("text", i), raw_image[y1:y2, x1:x2], nl))
             else:
                 if not nl:
                     text = text.replace("\n", "")
                 self.image_surrounding_texts.append(text)
-        pass
+        return pending
+    
+    def fill_ocr_text(self, slot: tuple, text: str):
+        """
+        將 OCR 結果寫回 collect_surroundings 所回傳的 slot
+        """
+        kind, i = slot
+        if kind == "figure_title":
+            self.image_figure_title_text = text
+        else:
+            self.image_surrounding_texts[i] = text
+    
+    def get_surroundings(self, raw_image: np.ndarray, nl=False, text_index: PageTextIndex = None):
+        """
+        功能: 從 __init__ 中提取出的 text box 以及 figure_title box 去 OCR 出文字
+        """
+        self.ocr_surroundings(self.collect_surroundings(raw_image, nl=nl, text_index=text_index))
+
+    def ocr_surroundings(self, slots: list):
+        """
+        逐一 OCR collect_surroundings 回傳的區塊並寫回
+        """
+        for slot, crop, slot_nl in slots:
+            ocr = ImgOcr(crop, nl=slot_nl, engine=self.ocr_engine, cache=self.result_cache)
+            self.fill_ocr_text(slot, ocr.extracted_text)
+    
+    def content_hash(self) -> str:
+        """
+        圖片內容的 sha256，相同的圖片會得到相同的值 (有原始編碼資料時直接以原始資料計算，不需要解碼)
+        """
+        if self.raw_bytes is not None:
+            return hashlib.sha256(self.raw_bytes).hexdigest()
+        return array_digest(self.image)
     
-    def save_image(self, path: str):
+    def save_raw_image(self, path: str):
+        """
+        將內嵌圖片的原始編碼資料原封不動寫入 path
+        """
         with open(path, "wb") as f:
-            with open(self.store_path, "rb") as r:
-                f.write(r.read())
-                r.close()
-                f.close()
-        
\ No newline at end of file
+            f.write(self.raw_bytes)
+    
+    def save_image(self, path: str, format: str = None, quality: int = None):
+        """
+        將圖片編碼後寫入 path (整個流程中只會編碼這一次)
+        format: png / jpeg / webp，預設由副檔名決定
+        quality: png 為壓縮等級 0-9 (預設 3)，jpeg / webp 為品質 0-100 (預設 95)
+        """
+        if format is None:
+            format = os.path.splitext(path)[1].lstrip(".") or "png"
+        format = format.lower()
+        if format == "jpg":
+            format = "jpeg"
+        img = Image.fromarray(self.image)
+        if format == "png":
+            img.save(path, format="PNG", compress_level=3 if quality is None else quality)
+        else:
+            img.save(path, format=format.upper(), quality=95 if quality is None else quality)
@@ -0,0 +1,168 @@
+import threading
+
+# 預設使用的 OCR 模型
+DEFAULT_DET_MODEL = "PP-OCRv5_server_det"
+DEFAULT_REC_MODEL = "PP-OCRv5_server_rec"
+# 辨識模型一次處理的文字區塊數
+DEFAULT_OCR_BATCH_SIZE = 16
+# 預設使用的 Layout 模型
+DEFAULT_LAYOUT_MODEL = "PP-DocLayout_plus-L"
+
+
+def device_name(gpu=False) -> str:
+    return "gpu" if gpu else "cpu"
+
+
+class LazyModel:
+    """
+    第一次使用時才載入模型，predict 會上鎖，因此多個執行緒可以共用同一個模型
+    子類別只需要實作 _load
+    """
+    device: str
+
+    def __init__(self, device: str):
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        raise NotImplementedError
+
+    def load(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+        return self
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def predict(self, *args, **kwargs):
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+            return self._model.predict(*args, **kwargs)
+
+    def close(self):
+        with self._lock:
+            self._model = None
+
+
+class OcrEngine(LazyModel):
+    """
+    包裝一個 PaddleOCR 物件
+    batch_size 同時決定辨識模型的 text_recognition_batch_size 與 predict_batch 每次送入的區塊數
+    """
+    det_model: str
+    rec_model: str
+    batch_size: int
+
+    def __init__(self, det_model: str, rec_model: str, device: str, batch_size: int = DEFAULT_OCR_BATCH_SIZE):
+        super().__init__(device)
+        self.det_model = det_model
+        self.rec_model = rec_model
+        self.batch_size = batch_size
+
+    def _load(self):
+        from paddleocr import PaddleOCR
+        kwargs = dict(
+            text_detection_model_name=self.det_model,
+            text_recognition_model_name=self.rec_model,
+            use_doc_orientation_classify=False,
+            use_doc_unwarping=False,
+            use_textline_orientation=False,
+            text_recognition_batch_size=self.batch_size,
+        )
+        if self.device != "cpu":
+            kwargs["device"] = self.device
+        return PaddleOCR(**kwargs)
+
+    def predict_batch(self, images: list, batch_size: int = None) -> list:
+        """
+        將多張圖片分批送進 OCR，回傳與 images 順序相同的結果
+        batch_size 預設為引擎的 batch_size (辨識模型的批次大小在建立引擎時就已決定)
+        """
+        batch_size = batch_size or self.batch_size
+        results = []
+        for i in range(0, len(images), batch_size):
+            results.extend(self.predict(images[i:i + batch_size]))
+        return results
+
+
+class LayoutEngine(LazyModel):
+    """
+    包裝一個 PaddleOCR LayoutDetection 物件
+    """
+    model_name: str
+
+    def __init__(self, model_name: str, device: str):
+        super().__init__(device)
+        self.model_name = model_name
+
+    def _load(self):
+        from paddleocr import LayoutDetection
+        if self.device != "cpu":
+            return LayoutDetection(model_name=self.model_name, device=self.device)
+        return LayoutDetection(model_name=self.model_name)
+
+    def predict_batch(self, images: list, batch_size: int = 4, **kwargs) -> list:
+        """
+        將多張頁面圖片 (numpy 陣列) 分批送進 Layout 模型，回傳與 images 順序相同的結果
+        """
+        results = []
+        for i in range(0, len(images), batch_size):
+            results.extend(self.predict(images[i:i + batch_size], batch_size=batch_size, **kwargs))
+        return results
+
+
+_registry_lock = threading.Lock()
+_ocr_engines = {}
+_layout_engines = {}
+
+
+def get_ocr_engine(gpu=False, det_model: str = DEFAULT_DET_MODEL, rec_model: str = DEFAULT_REC_MODEL, batch_size: int = DEFAULT_OCR_BATCH_SIZE) -> OcrEngine:
+    """
+    取得 (det_model, rec_model, device, batch_size) 對應的共用 OCR 引擎，整個 process 只會建立一次
+    不同的 batch_size 會是不同的引擎 (各自載入一份模型)
+    """
+    key = (det_model, rec_model, device_name(gpu), batch_size)
+    with _registry_lock:
+        engine = _ocr_engines.get(key)
+        if engine is None:
+            engine = OcrEngine(*key)
+            _ocr_engines[key] = engine
+    return engine
+
+
+def get_layout_engine(gpu=False, model_name: str = DEFAULT_LAYOUT_MODEL) -> LayoutEngine:
+    """
+    取得 (model_name, device) 對應的共用 Layout 模型，整個 process 只會建立一次
+    """
+    key = (model_name, device_name(gpu))
+    with _registry_lock:
+        engine = _layout_engines.get(key)
+        if engine is None:
+            engine = LayoutEngine(*key)
+            _layout_engines[key] = engine
+    return engine
+
+
+def warmup(gpu=False, det_model: str = DEFAULT_DET_MODEL, rec_model: str = DEFAULT_REC_MODEL, layout_model: str = DEFAULT_LAYOUT_MODEL, ocr_batch_size: int = DEFAULT_OCR_BATCH_SIZE):
+    """
+    預先載入模型，避免第一次使用時才付出載入時間
+    """
+    get_layout_engine(gpu, layout_model).load()
+    return get_ocr_engine(gpu, det_model, rec_model, ocr_batch_size).load()
+
+
+def shutdown():
+    """
+    釋放所有已載入的模型
+    """
+    with _registry_lock:
+        engines = list(_ocr_engines.values()) + list(_layout_engines.values())
+        _ocr_engines.clear()
+        _layout_engines.clear()
+    for engine in engines:
+        engine.close()
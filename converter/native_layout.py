@@ -0,0 +1,65 @@
+import re
+import fitz  # PyMuPDF
+
+from .placement_index import PagePlacementIndex
+from .tools.text_validation import is_garbled_text
+
+# 圖說常見的開頭，例如「圖 3」、「圖三」、「Fig. 2」、「Figure 1」
+FIGURE_TITLE_PATTERN = re.compile(r"^\s*(圖|Fig\.?|Figure)\s*[0-9一二三四五六七八九十]", re.IGNORECASE)
+
+
+def has_vector_graphics(page: fitz.Page, min_area_ratio: float = 0.01, background_coverage: float = 0.9) -> bool:
+    """
+    頁面上是否有明顯的向量繪圖 (圖表、流程圖等)
+    這些圖形沒有內嵌圖片可以對應，只有 Layout 模型能找到，因此不能走 native 路徑
+    幾乎覆蓋整頁的繪圖 (背景色、頁框) 不列入計算
+    """
+    page_area = page.rect.get_area() + 1e-9
+    drawings = [
+        d for d in page.get_drawings()
+        if (d["rect"] & page.rect).get_area() / page_area < background_coverage
+    ]
+    if not drawings:
+        return False
+    for r in page.cluster_drawings(drawings=drawings):
+        if (r & page.rect).get_area() / page_area >= min_area_ratio:
+            return True
+    return False
+
+
+def is_born_digital(page: fitz.Page, placements: PagePlacementIndex, scan_coverage: float = 0.9) -> bool:
+    """
+    判斷頁面是否為原生數位 (非掃描) 頁面，且所有圖片都能由內嵌圖片位置取得:
+        1. 文字層可以正常提取 (非亂碼)
+        2. 沒有一張幾乎覆蓋整頁的圖片 (掃描頁通常是一整張圖片加上 OCR 文字層)
+        3. 沒有明顯的向量繪圖 (見 has_vector_graphics)
+    """
+    if is_garbled_text(page.get_text("text")):
+        return False
+    page_area = page.rect.get_area() + 1e-9
+    for _, r in placements.placements:
+        if (r & page.rect).get_area() / page_area >= scan_coverage:
+            return False
+    return not has_vector_graphics(page)
+
+
+def native_layout_boxes(page: fitz.Page, placements: PagePlacementIndex, scale_x: float, scale_y: float, min_image_size: float = 32.0) -> list:
+    """
+    不經過 Layout 模型，直接由內嵌圖片擺放位置與文字區塊產生與 PP-DocLayout 相同格式的 boxes
+    座標會乘上 scale 換算成渲染後頁面圖片的像素座標
+    """
+    def to_pixels(r: fitz.Rect) -> list:
+        return [r.x0 * scale_x, r.y0 * scale_y, r.x1 * scale_x, r.y1 * scale_y]
+
+    boxes = []
+    for _, r in placements.placements:
+        r = r & page.rect
+        if r.is_empty or r.width < min_image_size or r.height < min_image_size:
+            continue # 太小的圖示不視為圖片
+        boxes.append({"label": "image", "score": 1.0, "coordinate": to_pixels(r)})
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks"):
+        if block_type != 0 or not text.strip():
+            continue
+        label = "figure_title" if FIGURE_TITLE_PATTERN.match(text) else "text"
+        boxes.append({"label": label, "score": 1.0, "coordinate": to_pixels(fitz.Rect(x0, y0, x1, y1) & page.rect)})
+    return boxes
@@ -0,0 +1,689 @@
+import os
+import shutil
+import fitz  # PyMuPDF
+import cv2
+import json
+import math
+from collections import OrderedDict
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .tools import random_uid
+from .tools.coordinates import map_bbox
+from .tools.pixmap import pixmap_to_array
+from .distance import page_box_array, pairwise_box_distance
+from .img_data import ImgData
+from .img2text import join_rec_texts
+from . import model_pool
+from .placement_index import PagePlacementIndex
+from .result_cache import ResultCache, layout_key, ocr_key
+from .text_layer import PageTextIndex
+from .native_layout import is_born_digital, native_layout_boxes
+from .dedupe import ImageDeduplicator
+from .render_policy import RenderPolicy
+from .stats import PipelineStats, profile
+
+# 匯出格式對應的副檔名
+IMAGE_EXTENSIONS = {"png": "png", "jpeg": "jpg", "jpg": "jpg", "webp": "webp", "jpx": "jp2"}
+# 可以重新編碼的匯出格式 (jpx 只用於原樣輸出內嵌圖片，PIL 無法編碼)
+ENCODE_FORMATS = ("png", "jpeg", "jpg", "webp")
+# 可以不重新編碼直接輸出的內嵌圖片格式 (extract_image 的 ext)
+PASSTHROUGH_FORMATS = {"png", "jpeg", "jpg", "jpx"}
+
+def match_xref_for_rect(page: fitz.Page, rect_pdf: fitz.Rect, index: PagePlacementIndex = None):
+    """
+    回傳：best_xref, best_image_rect, best_coverage
+    best_coverage = intersection_area / rect_area
+    index: 若有提供該頁的 PagePlacementIndex，直接從索引查詢，不再重複呼叫 MuPDF
+    """
+    if index is not None:
+        return index.match(rect_pdf)
+    rect_pdf = rect_pdf & page.rect  # 保險：裁到頁面內
+    if rect_pdf.is_empty:
+        return (None, None, 0.0)
+
+    best = (None, None, 0.0)
+
+    for img in page.get_images(full=True):
+        xref = img[0]
+        rects = page.get_image_rects(xref)  # 這張 xref 在頁面上出現的位置(可能多個)
+
+        for r in rects:
+            inter = r & rect_pdf
+            if inter.is_empty:
+                continue
+
+            coverage = inter.get_area() / (rect_pdf.get_area() + 1e-9)
+            if coverage > best[2]:
+                best = (xref, r, coverage)
+
+    return best
+
+class PdfInfo:
+    pdf_path: str
+    pdf_uid: str
+    pdf_name: str
+    tmp_files_path = "tmp/PdfInfo/"
+    pdf_doc: fitz.Document = None
+    use_gpu = False
+    ocr_engine: model_pool.OcrEngine = None
+    layout_engine: model_pool.LayoutEngine = None
+    result_cache: ResultCache = None
+    render_dpi = 100
+    
+    scanned_to_images = False
+    pdf_img_paths = []
+    pdf_page_images = [] # in_memory 模式下每頁的 RGB 陣列 (直接建立在 pixmap 的記憶體上)
+    
+    pdf_layouts = []
+    pdf_imgdatas = []
+    pdf_placement_indices: dict # page_index -> PagePlacementIndex
+    pdf_text_indices: dict # page_index -> PageTextIndex
+    pdf_xref_images: OrderedDict # xref -> extract_image 的結果 (LRU，只保留原始編碼資料)，重複出現的內嵌圖片只提取一次
+    pdf_xref_bytes = 0 # pdf_xref_images 中原始編碼資料的總大小
+    xref_cache_bytes = 64 * 1024 * 1024
+    image_format = "png"
+    image_quality: int = None
+    image_passthrough = False
+    render_policy: RenderPolicy = None
+    stats: PipelineStats = None
+    def __init__(self, pdf_path, gpu=False, cache: ResultCache = None, image_format: str = "png", image_quality: int = None, image_passthrough: bool = False, render_policy: RenderPolicy = None):
+        image_format = image_format.lower()
+        if image_format not in ENCODE_FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format} (use {', '.join(ENCODE_FORMATS)})")
+        self.pdf_path = pdf_path
+        self.pdf_uid = random_uid.generate()
+        self.tmp_files_path = os.path.join(self.tmp_files_path, self.pdf_uid)
+        self.pdf_name = os.path.splitext(os.path.basename(self.pdf_path))[0]
+        os.makedirs(self.tmp_files_path, exist_ok=True)
+        self.pdf_doc = fitz.open(self.pdf_path)
+        self.use_gpu = gpu
+        self.ocr_engine = model_pool.get_ocr_engine(gpu)
+        self.layout_engine = model_pool.get_layout_engine(gpu)
+        self.result_cache = cache # 以頁面 / 區塊內容雜湊快取 Layout 與 OCR 結果
+        self.pdf_placement_indices = {}
+        self.pdf_text_indices = {}
+        self.pdf_xref_images = OrderedDict()
+        self.pdf_xref_bytes = 0
+        # 匯出圖片的格式 (png / jpeg / webp) 與壓縮等級，見 ImgData.save_image
+        self.image_format = image_format
+        self.image_quality = image_quality
+        # 內嵌圖片 (JPEG / JPX / PNG) 直接以原始資料輸出，不重新編碼
+        self.image_passthrough = image_passthrough
+        self.render_policy = render_policy if render_policy is not None else RenderPolicy()
+        # 各階段耗時與計數，匯出時存成 metadata.json 旁邊的 stats.json
+        self.stats = PipelineStats()
+        
+    def warmup_models(self):
+        """
+        預先載入 Layout 與 OCR 模型 (模型由 model_pool 管理，同一個 process 內的 PdfInfo 會共用)
+        """
+        self.layout_engine.load()
+        self.ocr_engine.load()
+        
+    def to_images(self, dpi: int = 100, get_output_path: bool = False, in_memory: bool = False, spill_to_disk: bool = None):
+        """
+            將 PDF 每頁渲染成圖片後，再重組成「掃描型（影像型）」PDF。
+            in_memory=True 時直接保留 pixmap 的 numpy 陣列 (不複製、不經過 PNG 編碼)，交給後續流程使用
+            spill_to_disk: 是否另外存成 PNG 到 tmp 資料夾，預設為 not in_memory
+        """
+        if spill_to_disk is None:
+            spill_to_disk = not in_memory
+        temp_images_path = os.path.join(self.tmp_files_path, "extracted_images")
+        if spill_to_disk:
+            os.makedirs(temp_images_path, exist_ok=True)
+        image_paths = []
+        self.pdf_page_images = []
+        self.render_dpi = dpi
+        for i in range(len(self.pdf_doc)):
+            pix = self._render_page(i, dpi)
+            if spill_to_disk:
+                img_path = os.path.join(temp_images_path, f"page_{i+1:04d}.png")
+                pix.save(img_path)
+                image_paths.append(img_path)
+            if in_memory:
+                self.pdf_page_images.append(pixmap_to_array(pix)) # 陣列會持有 pixmap
+        
+        self.scanned_to_images = True
+        self.pdf_img_paths = image_paths
+        if get_output_path and spill_to_disk:
+            print(f"PDF is now converted to images, stored in {temp_images_path}.")
+            return temp_images_path
+        
+    def _render_page(self, page_index: int, dpi: int = 100) -> fitz.Pixmap:
+        zoom = dpi / 72.0
+        mat = fitz.Matrix(zoom, zoom)
+        page = self.pdf_doc[page_index]
+        self.stats.count("pages_rendered")
+        with self.stats.stage("render", page_index):
+            return page.get_pixmap(matrix=mat, alpha=False)  # alpha=False 避免透明通道
+        
+    def placement_index(self, page_index: int) -> PagePlacementIndex:
+        """
+        取得 (並快取) 該頁內嵌圖片擺放位置的索引
+        """
+        if page_index not in self.pdf_placement_indices:
+            self.pdf_placement_indices[page_index] = PagePlacementIndex(self.pdf_doc[page_index])
+        return self.pdf_placement_indices[page_index]
+        
+    def text_index(self, page_index: int) -> PageTextIndex:
+        """
+        取得 (並快取) 該頁文字層的索引，提取圖說時不必重複開啟文件與解析文字層
+        """
+        if page_index not in self.pdf_text_indices:
+            self.pdf_text_indices[page_index] = PageTextIndex(self.pdf_doc[page_index])
+        return self.pdf_text_indices[page_index]
+        
+    def extract_xref(self, xref: int) -> dict:
+        """
+        取得內嵌圖片原始的編碼資料 (extract_image 的結果，含 "image" bytes 與 "ext")
+        最近使用的圖片會保留 (總大小不超過 xref_cache_bytes)，重複出現的圖片不必重新提取
+        """
+        if xref in self.pdf_xref_images:
+            self.pdf_xref_images.move_to_end(xref)
+            return self.pdf_xref_images[xref]
+        info = self.pdf_doc.extract_image(xref)
+        size = len(info["image"])
+        if size <= self.xref_cache_bytes:
+            self.pdf_xref_images[xref] = info
+            self.pdf_xref_bytes += size
+            while self.pdf_xref_bytes > self.xref_cache_bytes:
+                _, old = self.pdf_xref_images.popitem(last=False)
+                self.pdf_xref_bytes -= len(old["image"])
+        return info
+        
+    def decode_xref(self, xref: int) -> np.ndarray:
+        """
+        解碼內嵌圖片為 RGB 陣列，每次呼叫都重新解碼 (快取中只保留原始編碼資料，解碼結果由呼叫端持有)
+        """
+        img_bytes = self.extract_xref(xref)["image"]  # bytes
+        return cv2.cvtColor(cv2.imdecode(
+            np.frombuffer(img_bytes, np.uint8),
+            cv2.IMREAD_COLOR               # BGR, uint8
+        ), cv2.COLOR_BGR2RGB)
+        
+    def page_count(self) -> int:
+        return len(self.pdf_page_images) if self.pdf_page_images else len(self.pdf_img_paths)
+        
+    def page_image(self, page_index: int) -> np.ndarray:
+        """
+        取得已渲染頁面的 RGB 陣列，優先使用記憶體中的頁面，否則從 tmp 的 PNG 讀取
+        """
+        if self.pdf_page_images:
+            return self.pdf_page_images[page_index]
+        return cv2.cvtColor(cv2.imread(self.pdf_img_paths[page_index]), cv2.COLOR_BGR2RGB)
+        
+    def _detect_layouts(self, pages: list, batch_size: int = 4, page_indices: list = None, route: str = "layout") -> list:
+        """
+        對多張 RGB 頁面進行 Layout 偵測，回傳的結果中 input_img 為原本的 RGB 頁面
+        若有設定 result_cache，已經偵測過的相同頁面會直接使用快取的 boxes
+        page_indices: pages 對應的頁碼 (0-based)，route 不是 "layout" 時需要提供
+        route:
+            "layout": 全部使用 Layout 模型
+            "native": 全部直接使用內嵌圖片與文字區塊，不經過模型
+            "auto": 原生數位頁面走 native，掃描 / 亂碼頁面才使用 Layout 模型
+        """
+        results = [None] * len(pages)
+        keys = [None] * len(pages)
+        todo = []
+        for k, page_img in enumerate(pages):
+            page_index = page_indices[k] if page_indices is not None else None
+            if route != "layout":
+                page = self.pdf_doc[page_index]
+                with self.stats.stage("layout", page_index):
+                    placements = self.placement_index(page_index)
+                    native = route == "native" or is_born_digital(page, placements)
+                    if native:
+                        (h, w) = page_img.shape[:2]
+                        boxes = native_layout_boxes(page, placements, w / page.rect.width, h / page.rect.height)
+                        results[k] = {"boxes": boxes, "input_img": page_img}
+                if native:
+                    self.stats.count("layout_native_pages")
+                    continue
+            if self.result_cache is not None:
+                keys[k] = layout_key(page_img, self.layout_engine.model_name, self.render_dpi)
+                boxes = self.result_cache.get(keys[k])
+                if boxes is not None:
+                    results[k] = {"boxes": boxes, "input_img": page_img}
+                    self.stats.count("layout_cache_hits")
+                    continue
+            todo.append(k)
+        if todo:
+            self.stats.count("layout_model_pages", len(todo))
+            with self.stats.stage("layout", [page_indices[k] for k in todo] if page_indices is not None else None):
+                preds = self.layout_engine.predict_batch(
+                    [cv2.cvtColor(pages[k], cv2.COLOR_RGB2BGR) for k in todo], # 模型輸入為 BGR
+                    batch_size=batch_size,
+                    layout_nms=True
+                )
+            for k, p in zip(todo, preds):
+                p['input_img'] = pages[k] # 使用原本擷取出來的圖片
+                results[k] = p
+                if self.result_cache is not None:
+                    boxes = [{f: b[f] for f in ("cls_id", "label", "score", "coordinate") if f in b} for b in p['boxes']]
+                    self.result_cache.put(keys[k], boxes)
+        return results
+        
+    def label_layout(self, output=False, batch_size: int = 4, route: str = "auto"):
+        """
+        將 pdf 的各種 Layout 標記出來，會使用 PP-DocLayout_plus-L 模型來進行偵測
+        模型由 model_pool 快取，頁面以 numpy 陣列每 batch_size 頁一批送進模型
+        route="auto" 時，文字層正常且沒有向量繪圖的原生數位頁面直接使用內嵌圖片位置與文字區塊，不經過模型
+        ("layout": 全部使用模型，"native": 全部不使用模型)
+        """
+        if not self.scanned_to_images:
+            self.to_images()
+            pass
+        self.pdf_layouts = []
+        n = self.page_count()
+        for i in range(0, n, batch_size):
+            page_indices = list(range(i, min(i + batch_size, n)))
+            pages = [self.page_image(j) for j in page_indices] # RGB
+            self.pdf_layouts.extend(self._detect_layouts(pages, batch_size=batch_size, page_indices=page_indices, route=route))
+            
+        if output:
+            for i, v in enumerate(self.pdf_layouts):
+                if not hasattr(v, "save_to_img"):
+                    continue # 來自快取的結果沒有可視化資料
+                v.save_to_img(f"output/{self.pdf_uid}/layout_detection/{i+1}.png")
+            print(f"Layout results saved into output/{self.pdf_uid}/layout_detection/")
+        return self.pdf_layouts
+    
+    def label_images(self, optimize_resolution=False, optimize_dpi="auto", use_xref=True):
+        """
+        將已經進行 Layout Labeling 的資料下去尋找圖片，並將所有找到的圖片放到 ImgData 物件裡面進行分析
+        optimize_dpi: 高畫質擷取時的 DPI，"auto" 表示由 render_policy 依區域大小、記憶體上限與內嵌圖片解析度決定
+        """
+        if not self.scanned_to_images:
+            self.to_images()
+            pass
+        self.pdf_imgdatas = []
+        for i0, l in enumerate(self.pdf_layouts):
+            self.pdf_imgdatas.extend(self._label_page_images(
+                i0, l,
+                optimize_resolution=optimize_resolution,
+                optimize_dpi=optimize_dpi,
+                use_xref=use_xref,
+                first_index=len(self.pdf_imgdatas)
+            ))
+        return self.pdf_imgdatas
+    
+    def _label_page_images(self, page_index: int, l: dict, optimize_resolution=False, optimize_dpi="auto", use_xref=True, first_index=0) -> list:
+        """
+        從單一頁面的 Layout 結果找出所有圖片，回傳該頁的 ImgData
+        first_index: 這一頁第一張圖片在整份文件中的編號 (只用於顯示)
+        """
+        image_box_indices = [i for i, v in enumerate(l['boxes']) if v["label"] == "image"]
+        if optimize_resolution:
+            # 將圖片座標換算成原版 pdf 的座標
+            page = self.pdf_doc[page_index]
+            pdf_raw_width = page.rect.width
+            pdf_raw_height = page.rect.height
+            (pdf_bitmap_height, pdf_bitmap_width) = l['input_img'].shape[:2]
+            rects = []
+            for i in image_box_indices:
+                x1, y1, x2, y2 = map(int, l['boxes'][i]['coordinate'])
+                (x1_t, y1_t, x2_t, y2_t) = map_bbox(x1, y1, x2, y2, pdf_bitmap_width, pdf_bitmap_height, pdf_raw_width, pdf_raw_height)
+                rects.append(fitz.Rect(int(x1_t), int(y1_t), int(x2_t), int(y2_t)))
+            # 先使用 xref 尋找可能符合的圖片，整頁的圖片一次查詢
+            with self.stats.stage("xref_match", page_index):
+                matches = self.placement_index(page_index).match_many(rects) if use_xref else [(None, None, 0.0)] * len(rects)
+        
+        # 同一頁所有圖片到所有 box 的距離一次算好
+        box_array = page_box_array(l['boxes'])
+        distances = pairwise_box_distance(box_array["coordinate"][image_box_indices], box_array["coordinate"], type="min")
+        
+        imgdatas = []
+        for k, i in enumerate(image_box_indices):
+            i_d = ImgData(
+                image=l['input_img'],
+                page_boxes=l['boxes'],
+                image_box_index=i,
+                gpu=self.use_gpu,
+                ocr_engine=self.ocr_engine,
+                box_array=box_array,
+                distances=distances[k]
+            )
+            i_d.img_page = page_index
+            i_d.raw_pdf_path = self.pdf_path
+            i_d.result_cache = self.result_cache
+            if optimize_resolution:
+                # 從原版的 pdf 文件用較高畫質擷取圖片範圍
+                now_img_data_index = first_index + len(imgdatas)
+                rect = rects[k]
+                use_render = not use_xref
+                if use_xref:
+                    (xref, _, cov) = matches[k]
+                    if xref is not None and cov >= 0.6:
+                        # 先保留原始編碼資料，需要像素時才解碼
+                        info = self.extract_xref(xref)
+                        i_d.set_raw_image(info["image"], info["ext"], decode=lambda xref=xref: self.decode_xref(xref))
+                        i_d.xref = xref
+                        self.stats.count("xref_hits")
+                        print(f"Image {now_img_data_index+1} using xref")
+                    else:
+                        use_render = True
+                if use_render:
+                    # 直接渲染出來並剪取圖片，optimize_dpi="auto" 時由 render_policy 依區域大小決定 DPI
+                    with self.stats.stage("render_crop", page_index):
+                        if optimize_dpi == "auto":
+                            # 區域幾乎被一張內嵌圖片覆蓋時，不超過該圖片本身的解析度
+                            index = self.placement_index(page_index)
+                            (xref, _, cov) = matches[k] if use_xref else index.match(rect)
+                            source_size = index.source_size(xref) if xref is not None and cov >= 0.6 else None
+                            dpi = self.render_policy.choose_dpi(rect, source_size=source_size)
+                        else:
+                            dpi = optimize_dpi
+                        i_d.update_image(self.render_policy.render(page, rect, dpi))
+                    self.stats.count("renders")
+                    print(f"Image {now_img_data_index+1} using render ({dpi} dpi)")
+                pass
+            imgdatas.append(i_d)
+        return imgdatas
+    
+    def extract_image_description(self, export=False, nl=False, batch_ocr=False, ocr_batch_size=16):
+        """
+        將所有圖片周圍的 title, text 的文字資料提取出來
+        方法: 先嘗試使用一般的 pdf 文字提取，若提取不到或是提取出來為亂碼會自動使用 OCR 來取得文字
+        batch_ocr=True 時分兩階段: 先收集整份文件所有需要 OCR 的區塊，再以 ocr_batch_size 為單位批次 OCR 後寫回對應的 ImgData
+        ocr_batch_size 也是辨識模型的批次大小，與 model_pool.DEFAULT_OCR_BATCH_SIZE 不同時會另外載入一份 OCR 模型
+        """
+        self._describe_images(self.pdf_imgdatas, self.page_image, nl=nl, batch_ocr=batch_ocr, ocr_batch_size=ocr_batch_size)
+        if export:
+            self.export_all_image_datas()
+            
+    def _describe_images(self, imgdatas: list, get_page_image, nl=False, batch_ocr=False, ocr_batch_size=16):
+        """
+        對 imgdatas 提取周圍文字，get_page_image(page_index) 需回傳該頁的 RGB 陣列
+        """
+        n = len(imgdatas)
+        page_bgr = {} # 同一頁的多張圖片共用同一份 BGR 頁面 (OCR 輸入為 BGR)
+        def get_page_bgr(page_index):
+            if page_index not in page_bgr:
+                page_bgr.clear()
+                page_bgr[page_index] = cv2.cvtColor(get_page_image(page_index), cv2.COLOR_RGB2BGR)
+            return page_bgr[page_index]
+        if not batch_ocr:
+            for i, img in enumerate(imgdatas):
+                print(f"Getting surrounding texts and figure_title of image {i+1}/{n}, reading page {img.img_page+1}")
+                raw_image = get_page_bgr(img.img_page)
+                with self.stats.stage("text_layer", img.img_page):
+                    slots = img.collect_surroundings(raw_image, nl=nl, text_index=self.text_index(img.img_page))
+                if slots:
+                    self.stats.count("ocr_regions", len(slots))
+                    with self.stats.stage("ocr", img.img_page):
+                        img.ocr_surroundings(slots)
+        else:
+            # 第一階段: 收集所有需要 OCR 的區塊
+            pending = []
+            for i, img in enumerate(imgdatas):
+                print(f"Collecting surrounding texts and figure_title of image {i+1}/{n}, reading page {img.img_page+1}")
+                raw_image = get_page_bgr(img.img_page)
+                with self.stats.stage("text_layer", img.img_page):
+                    slots = img.collect_surroundings(raw_image, nl=nl, text_index=self.text_index(img.img_page))
+                for slot, crop, slot_nl in slots:
+                    pending.append((img, slot, crop, slot_nl))
+            self.stats.count("ocr_regions", len(pending))
+            # 第二階段: 批次 OCR 後寫回
+            engine = self.ocr_engine
+            if engine.batch_size != ocr_batch_size:
+                engine = model_pool.get_ocr_engine(self.use_gpu, engine.det_model, engine.rec_model, ocr_batch_size)
+            if self.result_cache is not None:
+                todo = []
+                for img, slot, crop, slot_nl in pending:
+                    key = ocr_key(crop, engine.det_model, engine.rec_model)
+                    rec_texts = self.result_cache.get(key)
+                    if rec_texts is None:
+                        todo.append((img, slot, crop, slot_nl, key))
+                    else:
+                        img.fill_ocr_text(slot, join_rec_texts(rec_texts, nl=slot_nl))
+                self.stats.count("ocr_cache_hits", len(pending) - len(todo))
+            else:
+                todo = [(img, slot, crop, slot_nl, None) for img, slot, crop, slot_nl in pending]
+            if todo:
+                print(f"Running OCR on {len(todo)} text regions (batch size {ocr_batch_size})...")
+                with self.stats.stage("ocr", [p[0].img_page for p in todo]):
+                    results = engine.predict_batch([p[2] for p in todo])
+                for (img, slot, _, slot_nl, key), res in zip(todo, results):
+                    rec_texts = list(res["rec_texts"])
+                    if key is not None:
+                        self.result_cache.put(key, rec_texts)
+                    img.fill_ocr_text(slot, join_rec_texts(rec_texts, nl=slot_nl))
+            
+    def export_all_image_datas(self, path: str=None, dedupe=False, phash=False):
+        """
+        dedupe=True 時重複的圖片 (相同 xref / 內容，phash=True 時再加上 perceptual hash) 只會存一次，
+        metadata 中該圖片的 occurrences 會列出每一次出現的頁面與圖說
+        """
+        if path is None:
+            path = f"output/{self.pdf_uid}/image_datas/"
+        os.makedirs(path, exist_ok=True)
+        print(f"Exporting data into {path}...")
+        dedupe = ImageDeduplicator(use_phash=phash) if dedupe else None
+        entries = []
+        for img_data in self.pdf_imgdatas:
+            entry = self._export_image_data(img_data, f"image_{len(entries):04d}", path, dedupe=dedupe)
+            if entry is not None:
+                entries.append(entry)
+        self._write_metadata(path, entries)
+        print(f"Export successfully!")
+        
+    def _export_image_data(self, img_data: ImgData, name: str, path: str, dedupe: ImageDeduplicator = None) -> dict:
+        """
+        將單張圖片存到 path，回傳 metadata.json 中對應的項目
+        若有提供 dedupe 且圖片已經匯出過，只會在原本項目的 occurrences 加上這次出現的位置，並回傳 None
+        """
+        figure_title = ""
+        if img_data.image_has_figure_title:
+            figure_title = img_data.image_figure_title_text
+        occurrence = {"page": img_data.img_page+1, "coordinate": img_data.coordinate, "figure_title": figure_title, "surrounding_texts": img_data.image_surrounding_texts}
+        if dedupe is not None:
+            keys = dedupe.image_keys(img_data)
+            entry = dedupe.find(**keys)
+            if entry is not None:
+                entry["occurrences"].append(occurrence)
+                self.stats.count("dedupe_hits")
+                return None
+        with self.stats.stage("export", img_data.img_page):
+            if self.image_passthrough and img_data.raw_ext in PASSTHROUGH_FORMATS:
+                image_format = img_data.raw_ext
+                file_name = f"{name}.{IMAGE_EXTENSIONS[image_format]}"
+                img_data.save_raw_image(os.path.join(path, file_name))
+                self.stats.count("passthrough_images")
+            else:
+                image_format = self.image_format
+                file_name = f"{name}.{IMAGE_EXTENSIONS[image_format]}"
+                img_data.save_image(os.path.join(path, file_name), format=image_format, quality=self.image_quality)
+        self.stats.count("images_written")
+        self.stats.count("bytes_written", os.path.getsize(os.path.join(path, file_name)))
+        entry = {"name": name, "file": file_name, "format": image_format, **occurrence}
+        if dedupe is not None:
+            entry.update(keys)
+            entry["occurrences"] = [occurrence]
+            dedupe.add(entry, **keys)
+        return entry
+    
+    def _write_metadata(self, path: str, entries: list):
+        metadata = {}
+        metadata["name"] = self.pdf_name
+        metadata["uid"] = self.pdf_uid
+        metadata["imgs"] = entries
+        open(os.path.join(path, "metadata.json"), "w").write(json.dumps(metadata, ensure_ascii=False, indent=4))
+        self.stats.write(os.path.join(path, "stats.json"))
+        
+    def iter_pages(self, dpi: int = 100, window: int = 4, optimize_resolution=False, optimize_dpi="auto", use_xref=True, nl=False, batch_ocr=False, ocr_batch_size=16, pages=None, route="auto"):
+        """
+        逐頁串流處理: 渲染 → Layout → 擷取圖片 → 提取圖說，每次處理 window 頁
+        每處理完一頁就 yield (page_index, 該頁的 ImgData list)，呼叫端處理完後才釋放該頁的頁面圖片與 Layout 結果
+        記憶體用量只與 window 有關，與總頁數無關
+        pages: 只處理指定的頁面 (0-based)，預設為整份文件
+        route: 見 label_layout
+        """
+        if pages is None:
+            pages = range(len(self.pdf_doc))
+        pages = list(pages)
+        self.render_dpi = dpi
+        image_count = 0
+        for start in range(0, len(pages), window):
+            page_indices = pages[start:start + window]
+            page_imgs = [pixmap_to_array(self._render_page(i, dpi)) for i in page_indices]
+            layouts = self._detect_layouts(page_imgs, batch_size=window, page_indices=page_indices, route=route)
+            for k, page_index in enumerate(page_indices):
+                imgdatas = self._label_page_images(
+                    page_index, layouts[k],
+                    optimize_resolution=optimize_resolution,
+                    optimize_dpi=optimize_dpi,
+                    use_xref=use_xref,
+                    first_index=image_count
+                )
+                self._describe_images(imgdatas, lambda _, img=page_imgs[k]: img, nl=nl, batch_ocr=batch_ocr, ocr_batch_size=ocr_batch_size)
+                image_count += len(imgdatas)
+                yield page_index, imgdatas
+                # 呼叫端處理完這一頁 (繼續迭代) 後才釋放緩衝區，ImgData 的圖片是頁面緩衝區上的 view
+                layouts[k] = None
+                page_imgs[k] = None
+                self.pdf_placement_indices.pop(page_index, None)
+                self.pdf_text_indices.pop(page_index, None)
+    
+    def export_streaming(self, path: str=None, dpi: int = 100, window: int = 4, dedupe=False, phash=False, **kwargs):
+        """
+        使用 iter_pages 逐頁處理並即時匯出圖片，最後寫出 metadata.json
+        輸出格式與 export_all_image_datas 相同，但不會保留整份文件的頁面與 ImgData 在記憶體中
+        """
+        if path is None:
+            path = f"output/{self.pdf_uid}/image_datas/"
+        os.makedirs(path, exist_ok=True)
+        print(f"Exporting data into {path}...")
+        dedupe = ImageDeduplicator(use_phash=phash) if dedupe else None
+        entries = []
+        for page_index, imgdatas in self.iter_pages(dpi=dpi, window=window, **kwargs):
+            for img_data in imgdatas:
+                entry = self._export_image_data(img_data, f"image_{len(entries):04d}", path, dedupe=dedupe)
+                if entry is not None:
+                    entries.append(entry)
+        self._write_metadata(path, entries)
+        print(f"Export successfully!")
+        
+    def export_parallel(self, path: str=None, workers: int = None, dpi: int = 100, window: int = 4, pages_per_task: int = None, dedupe=False, phash=False, **kwargs):
+        """
+        將頁面切成連續的範圍分給多個 process 處理，每個 process 會開啟自己的 fitz.Document 並使用自己快取的模型
+        所有結果最後合併成一份 metadata.json，圖片編號與頁面順序與單一 process 執行時相同
+        dedupe: 每個 process 先在自己的範圍內去除重複，合併時再去除跨範圍的重複
+        """
+        if path is None:
+            path = f"output/{self.pdf_uid}/image_datas/"
+        os.makedirs(path, exist_ok=True)
+        workers = workers or os.cpu_count() or 1
+        n = len(self.pdf_doc)
+        if pages_per_task is None:
+            pages_per_task = max(1, math.ceil(n / workers))
+        ranges = [(start, min(start + pages_per_task, n)) for start in range(0, n, pages_per_task)]
+        print(f"Exporting data into {path} with {workers} workers ({len(ranges)} page ranges)...")
+        with ProcessPoolExecutor(max_workers=workers, initializer=model_pool.warmup, initargs=(self.use_gpu,)) as executor:
+            futures = [
+                executor.submit(_export_page_range, self.pdf_path, start, end, path, self.use_gpu, dpi, window, kwargs, dedupe, phash, self.image_format, self.image_quality, self.image_passthrough, self.result_cache, self.render_policy)
+                for (start, end) in ranges
+            ]
+            # 依照頁面範圍的順序合併，確保圖片編號與單一 process 相同
+            entries = []
+            for future in futures:
+                (part, report) = future.result()
+                entries.extend(part)
+                self.stats.merge(report)
+        self.merge_exported_parts(path, entries, dedupe=dedupe, phash=phash)
+        print(f"Export successfully!")
+
+    def merge_exported_parts(self, path: str, entries: list, dedupe=False, phash=False) -> list:
+        """
+        合併 _export_page_range 的結果 (需依頁面順序排列): 去除跨範圍重複的圖片、
+        將暫時名稱 part_* 改為 image_NNNN，並寫出 metadata.json
+        """
+        if dedupe:
+            # 合併不同範圍之間重複的圖片
+            merger = ImageDeduplicator(use_phash=phash)
+            unique = []
+            for entry in entries:
+                keys = {k: entry.get(k) for k in ("xref", "sha256", "phash")}
+                existing = merger.find(**keys)
+                if existing is not None:
+                    existing["occurrences"].extend(entry["occurrences"])
+                    file_path = os.path.join(path, entry["file"])
+                    self.stats.count("dedupe_hits")
+                    self.stats.count("images_written", -1)
+                    self.stats.count("bytes_written", -os.path.getsize(file_path))
+                    os.remove(file_path)
+                    continue
+                merger.add(entry, **keys)
+                unique.append(entry)
+            entries = unique
+        for i, entry in enumerate(entries):
+            name = f"image_{i:04d}"
+            file_name = name + os.path.splitext(entry["file"])[1]
+            os.replace(os.path.join(path, entry["file"]), os.path.join(path, file_name))
+            entry["name"] = name
+            entry["file"] = file_name
+        self._write_metadata(path, entries)
+        return entries
+            
+    def export_all_images_and_image_descriptions(self, stream=False, window=4, workers=1, path: str=None, dedupe=False, profile_backend: str = None):
+        """
+        Docstring for export_all_images_and_image_descriptions
+        
+        :param self: Description
+        :param stream: True 時使用 export_streaming 逐頁處理，記憶體用量只與 window 有關
+        :param workers: 大於 1 時使用 export_parallel 以多個 process 平行處理頁面
+        :param path: 輸出資料夾，預設為 output/{pdf_uid}/image_datas/
+        :param dedupe: 重複出現的圖片只存一次，見 export_all_image_datas
+        :param profile_backend: "cprofile" 或 "pyinstrument"，對整個流程做 profiling 並存到 path 中的 profile.prof / profile.html
+        說明:
+            將上面的方法全部結合起來，一個指令直接提取 pdf 中所有圖片以及可能的說明文字
+            各階段的耗時與計數會存在 metadata.json 旁邊的 stats.json
+        """
+        if path is None:
+            path = f"output/{self.pdf_uid}/image_datas/"
+        if profile_backend is None:
+            self._export_all(stream, window, workers, path, dedupe)
+            return
+        profile_name = "profile.html" if profile_backend == "pyinstrument" else "profile.prof"
+        with profile(os.path.join(path, profile_name), backend=profile_backend):
+            self._export_all(stream, window, workers, path, dedupe)
+        
+    def _export_all(self, stream, window, workers, path, dedupe):
+        if workers > 1:
+            self.export_parallel(path=path, workers=workers, dpi=100, window=window, dedupe=dedupe)
+            return
+        if stream:
+            self.export_streaming(path=path, dpi=100, window=window, dedupe=dedupe)
+            return
+        self.to_images(dpi=100, in_memory=True)
+        self.label_layout()
+        self.label_images()
+        self.extract_image_description()
+        self.export_all_image_datas(path, dedupe=dedupe)
+        
+    def __del__(self):
+        if self.pdf_doc is None:
+            return # __init__ 在開啟文件前就失敗 (例如不支援的 image_format)
+        self.pdf_doc.close()
+        if os.path.exists(self.tmp_files_path):
+            try:
+                shutil.rmtree(self.tmp_files_path)
+            except Exception as e:
+                print(f"Please try manual delete {self.tmp_files_path}")
+
+
+def _export_page_range(pdf_path: str, page_start: int, page_end: int, path: str, gpu: bool, dpi: int, window: int, kwargs: dict, dedupe=False, phash=False, image_format="png", image_quality=None, image_passthrough=False, cache: ResultCache = None, render_policy: RenderPolicy = None) -> list:
+    """
+    export_parallel 的 worker: 處理 [page_start, page_end) 的頁面並將圖片以暫時名稱存到 path
+    cache / render_policy 為主 process 的 PdfInfo 設定，worker 使用相同的快取目錄與渲染策略
+    回傳 (該範圍內依頁面順序排列的 metadata 項目, 該範圍的 stats report)
+    """
+    pdf = PdfInfo(pdf_path, gpu=gpu, cache=cache, image_format=image_format, image_quality=image_quality, image_passthrough=image_passthrough, render_policy=render_policy)
+    dedupe = ImageDeduplicator(use_phash=phash) if dedupe else None
+    entries = []
+    for page_index, imgdatas in pdf.iter_pages(dpi=dpi, window=window, pages=range(page_start, page_end), **kwargs):
+        for k, img_data in enumerate(imgdatas):
+            entry = pdf._export_image_data(img_data, f"part_{page_index:05d}_{k:03d}", path, dedupe=dedupe)
+            if entry is not None:
+                entries.append(entry)
+    return entries, pdf.stats.report()
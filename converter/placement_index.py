@@ -0,0 +1,77 @@
+import math
+import fitz  # PyMuPDF
+
+
+class PagePlacementIndex:
+    """
+    一頁中所有內嵌圖片的擺放位置 (xref, rect)，只需呼叫一次 page.get_image_info
+    位置依照固定大小的網格建立索引，查詢時只會檢查與查詢範圍重疊的網格中的圖片
+    """
+    placements: list # [(xref, fitz.Rect), ...]
+    cell_size: float
+
+    def __init__(self, page: fitz.Page, cell_size: float = 64.0):
+        self.page_rect = page.rect
+        self.cell_size = cell_size
+        self.placements = []
+        self.source_sizes = {} # xref -> 內嵌圖片本身的 (width, height) 像素
+        for info in page.get_image_info(xrefs=True):
+            xref = info.get("xref", 0)
+            if xref <= 0:
+                continue # inline image，沒有 xref 可以提取
+            r = fitz.Rect(info["bbox"])
+            if r.is_empty:
+                continue
+            self.placements.append((xref, r))
+            self.source_sizes[xref] = (info.get("width", 0), info.get("height", 0))
+        self._grid = {}
+        for i, (_, r) in enumerate(self.placements):
+            for cell in self._cells(r):
+                self._grid.setdefault(cell, []).append(i)
+
+    def __len__(self):
+        return len(self.placements)
+
+    def _cells(self, r: fitz.Rect):
+        s = self.cell_size
+        for cx in range(math.floor(r.x0 / s), math.floor(r.x1 / s) + 1):
+            for cy in range(math.floor(r.y0 / s), math.floor(r.y1 / s) + 1):
+                yield (cx, cy)
+
+    def candidates(self, rect: fitz.Rect) -> set:
+        """
+        回傳可能與 rect 重疊的圖片擺放位置 (placements 的 index)
+        """
+        found = set()
+        for cell in self._cells(rect):
+            found.update(self._grid.get(cell, ()))
+        return found
+
+    def match(self, rect_pdf: fitz.Rect):
+        """
+        與 match_xref_for_rect 相同的回傳格式: best_xref, best_image_rect, best_coverage
+        """
+        rect_pdf = rect_pdf & self.page_rect  # 保險：裁到頁面內
+        if rect_pdf.is_empty:
+            return (None, None, 0.0)
+
+        best = (None, None, 0.0)
+        area = rect_pdf.get_area() + 1e-9
+        for i in sorted(self.candidates(rect_pdf)):
+            xref, r = self.placements[i]
+            inter = r & rect_pdf
+            if inter.is_empty:
+                continue
+            coverage = inter.get_area() / area
+            if coverage > best[2]:
+                best = (xref, r, coverage)
+        return best
+
+    def source_size(self, xref: int) -> tuple:
+        return self.source_sizes.get(xref)
+
+    def match_many(self, rects: list) -> list:
+        """
+        一次查詢同一頁中的多個範圍
+        """
+        return [self.match(r) for r in rects]
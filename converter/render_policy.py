@@ -0,0 +1,76 @@
+import math
+import numpy as np
+import fitz  # PyMuPDF
+
+from .tools.pixmap import pixmap_to_array
+
+
+class RenderPolicy:
+    """
+    依照區域大小決定擷取圖片時的渲染 DPI，並在區域過大時分塊渲染
+        1. 以 target_long_side 決定長邊的目標像素數
+        2. 若區域下方有內嵌圖片，不超過該圖片本身的解析度 (再高也只是放大)
+        3. 限制在 [min_dpi, max_dpi] 之間，且整張結果不超過 max_bytes
+        4. 像素數超過 tile_max_pixels 時分塊渲染，每次 MuPDF 只需要配置一個 tile 的 pixmap
+    """
+    target_long_side: int
+    min_dpi: int
+    max_dpi: int
+    max_bytes: int
+    tile_max_pixels: int
+
+    def __init__(self, target_long_side: int = 2048, min_dpi: int = 72, max_dpi: int = 600, max_bytes: int = 64 << 20, tile_max_pixels: int = 2048 * 2048):
+        self.target_long_side = target_long_side
+        self.min_dpi = min_dpi
+        self.max_dpi = max_dpi
+        self.max_bytes = max_bytes
+        self.tile_max_pixels = tile_max_pixels
+
+    def choose_dpi(self, rect: fitz.Rect, source_size: tuple = None, channels: int = 3) -> int:
+        """
+        rect: 要渲染的區域 (pdf 座標，1 pt = 1/72 inch)
+        source_size: 區域下方內嵌圖片的 (width, height) 像素，沒有則為 None
+        """
+        width_in = max(rect.width, 1e-3) / 72.0
+        height_in = max(rect.height, 1e-3) / 72.0
+        dpi = self.target_long_side / max(width_in, height_in)
+        if source_size is not None:
+            src_w, src_h = source_size
+            dpi = min(dpi, max(src_w / width_in, src_h / height_in))
+        dpi = min(max(dpi, self.min_dpi), self.max_dpi)
+        # 記憶體上限優先於 min_dpi
+        budget_dpi = math.sqrt(self.max_bytes / channels / (width_in * height_in))
+        return max(1, int(min(dpi, budget_dpi)))
+
+    def render(self, page: fitz.Page, rect: fitz.Rect, dpi: int) -> np.ndarray:
+        """
+        以 dpi 渲染 rect 範圍，回傳 RGB 陣列；像素數過大時分塊渲染後拼接
+        """
+        zoom = dpi / 72.0
+        out_w = max(1, int(round(rect.width * zoom)))
+        out_h = max(1, int(round(rect.height * zoom)))
+        if out_w * out_h <= self.tile_max_pixels:
+            pix = page.get_pixmap(dpi=dpi, clip=rect, colorspace=fitz.csRGB, alpha=False)
+            return pixmap_to_array(pix)
+
+        out = np.empty((out_h, out_w, 3), dtype=np.uint8)
+        tile = max(1, int(math.sqrt(self.tile_max_pixels)))
+        mat = fitz.Matrix(zoom, zoom)
+        for py in range(0, out_h, tile):
+            for px in range(0, out_w, tile):
+                py1 = min(py + tile, out_h)
+                px1 = min(px + tile, out_w)
+                clip = fitz.Rect(
+                    rect.x0 + px / zoom, rect.y0 + py / zoom,
+                    rect.x0 + px1 / zoom, rect.y0 + py1 / zoom,
+                )
+                pix = page.get_pixmap(matrix=mat, clip=clip, colorspace=fitz.csRGB, alpha=False)
+                part = pixmap_to_array(pix)
+                h = min(part.shape[0], py1 - py)
+                w = min(part.shape[1], px1 - px)
+                out[py:py + h, px:px + w] = part[:h, :w, :3]
+                if h > 0 and w > 0 and (h < py1 - py or w < px1 - px):
+                    # MuPDF 的取整可能少 1 px，用邊緣像素補齊
+                    out[py + h:py1, px:px + w] = out[py + h - 1:py + h, px:px + w]
+                    out[py:py1, px + w:px1] = out[py:py1, px + w - 1:px + w]
+        return out
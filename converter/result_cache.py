@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+
+def array_digest(img: np.ndarray) -> str:
+    """
+    以圖片像素 (含形狀) 計算 sha256，相同的頁面或裁切區塊會得到相同的值
+    """
+    h = hashlib.sha256()
+    h.update(str(img.shape).encode("utf-8"))
+    h.update(memoryview(np.ascontiguousarray(img)).cast("B"))
+    return h.hexdigest()
+
+
+def make_key(*parts) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def layout_key(page_img: np.ndarray, model_name: str, dpi: int) -> str:
+    return make_key("layout", model_name, dpi, array_digest(page_img))
+
+
+def ocr_key(crop: np.ndarray, det_model: str, rec_model: str) -> str:
+    return make_key("ocr", det_model, rec_model, array_digest(crop))
+
+
+def to_jsonable(v):
+    """
+    將模型輸出 (numpy 數值 / 陣列) 轉成可以存成 JSON 的型別
+    """
+    if isinstance(v, dict):
+        return {k: to_jsonable(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [to_jsonable(x) for x in v]
+    if isinstance(v, np.ndarray):
+        return v.tolist()
+    if isinstance(v, np.generic):
+        return v.item()
+    return v
+
+
+class ResultCache:
+    """
+    以內容雜湊為 key 的磁碟快取，用來保存 Layout boxes 以及 OCR 文字
+    檔案存放在 {cache_dir}/{key[:2]}/{key}.json，超過 max_bytes 時依最後使用時間 (mtime) 刪除最舊的項目
+    目錄的總大小在第一次 put 時才掃描，之後累加自己寫入的大小；
+    每寫入 max_bytes 的 1/10 重新掃描一次，納入其他 process 寫入的檔案
+    """
+    cache_dir: str
+    max_bytes: int
+
+    def __init__(self, cache_dir: str = "cache/results", max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = None # 尚未掃描
+        self._written_since_scan = 0
+
+    def __getstate__(self):
+        # 傳給 export_parallel 的 worker process 時不包含 lock
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _iter_files(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+    def _scan(self):
+        total = 0
+        for p in self._iter_files():
+            try:
+                total += os.path.getsize(p)
+            except OSError:
+                pass # 其他 process 剛好刪除
+        self._total_bytes = total
+        self._written_since_scan = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # 更新最後使用時間，供 LRU 淘汰使用
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(to_jsonable(value), ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._total_bytes is None or self._written_since_scan > self.max_bytes // 10:
+                self._scan()
+            else:
+                self._total_bytes += len(data) - old_size
+                self._written_since_scan += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = []
+        for p in self._iter_files():
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        files.sort()
+        self._written_since_scan = 0
+        total = sum(f[1] for f in files)
+        # 淘汰到容量的 90%，避免每次 put 都觸發
+        target = int(self.max_bytes * 0.9)
+        for _, size, p in files:
+            if total <= target:
+                break
+            try:
+                os.remove(p)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    def clear(self):
+        with self._lock:
+            for p in list(self._iter_files()):
+                os.remove(p)
+            self._total_bytes = 0
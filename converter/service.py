@@ -0,0 +1,429 @@
+"""
+常駐的非同步擷取服務: 以 HTTP 接收 PDF，放入工作佇列，並逐頁回報進度與結果
+模型在 worker process 啟動時就載入 (model_pool.warmup)，之後的工作不需要再次載入模型
+
+用法:
+    python -m converter.service -o output/service -w 2 --port 8080
+
+API (只使用標準函式庫，沒有額外相依套件):
+    POST /jobs?name=a.pdf&dedupe=1       body 為 PDF 檔案內容，回傳 202 與 job id；佇列已滿時回傳 503
+    GET  /jobs                           所有工作的狀態
+    GET  /jobs/{id}                      單一工作的狀態
+    GET  /jobs/{id}/events               以 NDJSON 串流回傳進度 (started / page / done / failed)，直到工作結束
+    GET  /jobs/{id}/metadata             完成後的 metadata.json
+    GET  /jobs/{id}/files/{file}         完成後的圖片檔案
+    GET  /health                         佇列與執行中工作的數量
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+import traceback
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from . import model_pool
+from .batch import STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED
+from .tools import random_uid
+
+HTTP_REASONS = {
+    200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class Job:
+    """
+    一份 PDF 的擷取工作，events 會保留所有進度事件，讓晚連線的客戶端也能從頭取得
+    """
+    id: str
+    pdf_path: str
+    output: str
+    options: dict
+    status: str
+    pages: int
+    pages_done: int
+    images: int
+    error: str
+
+    def __init__(self, job_id: str, name: str, pdf_path: str, output: str, options: dict):
+        self.id = job_id
+        self.name = name
+        self.pdf_path = pdf_path
+        self.output = output
+        self.options = options
+        self.status = STATUS_PENDING
+        self.pages = None
+        self.pages_done = 0
+        self.images = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (STATUS_DONE, STATUS_FAILED)
+
+    async def emit(self, event: str, **fields):
+        self.events.append({"event": event, "job": self.id, "time": round(time.time(), 3), **fields})
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def follow(self):
+        """
+        依序 yield 所有事件 (包含已經發生的)，工作結束後停止
+        """
+        i = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.events) > i or self.finished)
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.finished:
+                return
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "pages": self.pages,
+            "pages_done": self.pages_done,
+            "images": self.images,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ExtractionService:
+    """
+    工作佇列與排程:
+        1. 佇列最多 max_queue 份等待中的工作，超過時 submit 會丟出 asyncio.QueueFull (HTTP 503)，由客戶端稍後重試
+        2. 同時最多執行 max_jobs 份工作，每份工作切成 pages_per_task 頁的範圍交給 worker process
+        3. 所有工作共用 workers 個 process，同時送出的頁面範圍最多 2 * workers 個，避免單一大檔案佔滿 pool
+    """
+    output_root: str
+    workers: int
+    max_jobs: int
+    max_queue: int
+    pages_per_task: int
+    max_upload_bytes: int
+    keep_jobs: int
+
+    def __init__(self, output_root: str = "output/service", workers: int = 1, max_jobs: int = 2, max_queue: int = 16, pages_per_task: int = 1,
+                 gpu=False, dpi: int = 100, window: int = 4, max_upload_bytes: int = 256 << 20, keep_jobs: int = 256):
+        self.output_root = output_root
+        self.workers = max(1, workers)
+        self.max_jobs = max(1, max_jobs)
+        self.max_queue = max_queue
+        self.pages_per_task = max(1, pages_per_task)
+        self.use_gpu = gpu
+        self.dpi = dpi
+        self.window = window
+        self.max_upload_bytes = max_upload_bytes
+        self.keep_jobs = keep_jobs
+        self.jobs = OrderedDict() # job id -> Job
+        self._queue = None
+        self._slots = None
+        self._executor = None
+        self._runners = []
+
+    async def start(self):
+        """
+        建立 worker process 並預先載入模型，之後啟動 max_jobs 個工作執行者
+        """
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(2 * self.workers)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=model_pool.warmup, initargs=(self.use_gpu,))
+        # 送出 workers 個空工作，讓 process 在第一份 PDF 到達前就啟動並載入模型
+        await asyncio.gather(*(asyncio.wrap_future(self._executor.submit(os.getpid)) for _ in range(self.workers)))
+        self._runners = [asyncio.create_task(self._runner()) for _ in range(self.max_jobs)]
+
+    async def stop(self):
+        for task in self._runners:
+            task.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._runners = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def running(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == STATUS_RUNNING)
+
+    async def submit(self, pdf_bytes: bytes, name: str = "document.pdf", **options) -> Job:
+        """
+        將上傳的 PDF 存到 {output_root}/{job id}/ 並放入佇列 (寫檔在 thread pool 中進行，不會卡住 event loop)
+        options: dedupe / phash / image_format / passthrough，見 PdfInfo.export_parallel
+        """
+        if self._queue.full():
+            raise asyncio.QueueFull()
+        job_id = random_uid.generate()
+        job_dir = os.path.join(self.output_root, job_id)
+        pdf_path = os.path.join(job_dir, "input.pdf")
+        await asyncio.get_running_loop().run_in_executor(None, _write_file, pdf_path, pdf_bytes)
+        job = Job(job_id, name, pdf_path, os.path.join(job_dir, "image_datas"), options)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            # 寫檔期間佇列被其他請求填滿
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        self.jobs[job_id] = job
+        self._forget_old_jobs()
+        return job
+
+    def _forget_old_jobs(self):
+        # 只保留最近 keep_jobs 份工作的狀態 (輸出檔案不會被刪除)
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.keep_jobs:
+                break
+            if self.jobs[job_id].finished:
+                del self.jobs[job_id]
+
+    async def _runner(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run_job(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: Job):
+        from .pdf_info import PdfInfo, _export_page_range
+        loop = asyncio.get_running_loop()
+        job.status = STATUS_RUNNING
+        pending = []
+        try:
+            pdf = await loop.run_in_executor(None, PdfInfo, job.pdf_path, self.use_gpu)
+            job.pages = len(pdf.pdf_doc)
+            os.makedirs(job.output, exist_ok=True)
+            await job.emit("started", pages=job.pages)
+
+            opts = job.options
+            ranges = [(start, min(start + self.pages_per_task, job.pages)) for start in range(0, job.pages, self.pages_per_task)]
+
+            async def run_range(start: int, end: int):
+                async with self._slots:
+                    future = self._executor.submit(
+                        _export_page_range, job.pdf_path, start, end, job.output, self.use_gpu, self.dpi, self.window, {},
+                        opts.get("dedupe", False), opts.get("phash", False), opts.get("image_format", "png"), None, opts.get("passthrough", False),
+                    )
+                    (entries, report) = await asyncio.wrap_future(future)
+                    pdf.stats.merge(report)
+                    return start, end, entries
+
+            pending = [asyncio.create_task(run_range(start, end)) for (start, end) in ranges]
+            parts = {}
+            for done in asyncio.as_completed(pending):
+                start, end, entries = await done
+                parts[start] = entries
+                job.pages_done += end - start
+                # 圖片檔案在工作完成前使用暫時名稱 (part_*)，最終名稱見 done 之後的 metadata
+                await job.emit("page", page_start=start + 1, page_end=end, pages_done=job.pages_done, images=entries)
+
+            entries = [entry for start in sorted(parts) for entry in parts[start]]
+            entries = await loop.run_in_executor(None, pdf.merge_exported_parts, job.output, entries, opts.get("dedupe", False), opts.get("phash", False))
+            job.images = len(entries)
+            job.status = STATUS_DONE
+            job.finished_at = time.time()
+            await job.emit("done", images=job.images, seconds=round(job.finished_at - job.created_at, 3))
+        except Exception:
+            for task in pending:
+                task.cancel()
+            job.error = traceback.format_exc()
+            job.status = STATUS_FAILED
+            job.finished_at = time.time()
+            await job.emit("failed", error=job.error)
+
+    # ---- HTTP ----
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        asyncio.start_server 的 callback，每個連線只處理一個請求
+        """
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, value = line.decode("latin-1").split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+            url = urllib.parse.urlsplit(target)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            length = int(headers.get("content-length", 0))
+            if length > self.max_upload_bytes:
+                await self._send_json(writer, 413, {"error": f"upload larger than {self.max_upload_bytes} bytes"})
+                return
+            body = await reader.readexactly(length) if length else b""
+            await self._route(writer, method.upper(), url.path.rstrip("/") or "/", query, body)
+        except (ValueError, asyncio.IncompleteReadError):
+            await self._send_json(writer, 400, {"error": "malformed request"})
+        except ConnectionError:
+            pass
+        except Exception:
+            await self._send_json(writer, 500, {"error": traceback.format_exc()})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _route(self, writer: asyncio.StreamWriter, method: str, path: str, query: dict, body: bytes):
+        parts = path.strip("/").split("/")
+        if path == "/health":
+            await self._send_json(writer, 200, {"status": "ok", "queued": self._queue.qsize(), "running": self.running, "workers": self.workers})
+            return
+        if parts[0] != "jobs":
+            await self._send_json(writer, 404, {"error": "not found"})
+            return
+        if len(parts) == 1:
+            if method == "POST":
+                await self._post_job(writer, query, body)
+            elif method == "GET":
+                await self._send_json(writer, 200, {"jobs": [job.summary() for job in self.jobs.values()]})
+            else:
+                await self._send_json(writer, 405, {"error": "method not allowed"})
+            return
+        job = self.jobs.get(parts[1])
+        if job is None:
+            await self._send_json(writer, 404, {"error": "job not found"})
+            return
+        if method != "GET":
+            await self._send_json(writer, 405, {"error": "method not allowed"})
+            return
+        if len(parts) == 2:
+            await self._send_json(writer, 200, job.summary())
+        elif parts[2] == "events":
+            await self._stream_events(writer, job)
+        elif parts[2] in ("metadata", "files") and job.status != STATUS_DONE:
+            await self._send_json(writer, 409, {"error": f"job is {job.status}"})
+        elif parts[2] == "metadata":
+            await self._send_file(writer, os.path.join(job.output, "metadata.json"), "application/json")
+        elif parts[2] == "files" and len(parts) == 4 and parts[3] == os.path.basename(parts[3]):
+            await self._send_file(writer, os.path.join(job.output, parts[3]), "application/octet-stream")
+        else:
+            await self._send_json(writer, 404, {"error": "not found"})
+
+    async def _post_job(self, writer: asyncio.StreamWriter, query: dict, body: bytes):
+        if not body.startswith(b"%PDF"):
+            await self._send_json(writer, 400, {"error": "body is not a PDF"})
+            return
+        from .pdf_info import ENCODE_FORMATS
+        image_format = query.get("image_format", "png").lower()
+        if image_format not in ENCODE_FORMATS:
+            formats = ", ".join(ENCODE_FORMATS)
+            await self._send_json(writer, 400, {"error": f"unsupported image_format: {image_format} (use {formats})"})
+            return
+        flag = lambda key: query.get(key, "0").lower() in ("1", "true", "yes")
+        try:
+            job = await self.submit(
+                body,
+                name=query.get("name", "document.pdf"),
+                dedupe=flag("dedupe"),
+                phash=flag("phash"),
+                image_format=image_format,
+                passthrough=flag("passthrough"),
+            )
+        except asyncio.QueueFull:
+            await self._send_json(writer, 503, {"error": "queue is full, retry later"}, extra_headers={"Retry-After": "5"})
+            return
+        await self._send_json(writer, 202, job.summary())
+
+    async def _stream_events(self, writer: asyncio.StreamWriter, job: Job):
+        # 以連線關閉作為結尾 (不使用 chunked)，每行一個 JSON 事件
+        self._write_head(writer, 200, "application/x-ndjson")
+        async for event in job.follow():
+            writer.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+            await writer.drain()
+
+    async def _send_file(self, writer: asyncio.StreamWriter, file_path: str, content_type: str):
+        if not os.path.isfile(file_path):
+            await self._send_json(writer, 404, {"error": "file not found"})
+            return
+        data = await asyncio.get_running_loop().run_in_executor(None, _read_file, file_path)
+        self._write_head(writer, 200, content_type, len(data))
+        writer.write(data)
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, obj, extra_headers: dict = None):
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self._write_head(writer, status, "application/json; charset=utf-8", len(data), extra_headers)
+        writer.write(data)
+        await writer.drain()
+
+    def _write_head(self, writer: asyncio.StreamWriter, status: int, content_type: str, length: int = None, extra_headers: dict = None):
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}", f"Content-Type: {content_type}", "Connection: close"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        for key, value in (extra_headers or {}).items():
+            lines.append(f"{key}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+
+def _read_file(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def _write_file(file_path: str, data: bytes):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as f:
+        f.write(data)
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8080, **kwargs):
+    service = ExtractionService(**kwargs)
+    await service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving on http://{host}:{port} ({service.workers} workers, {service.max_jobs} concurrent jobs)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve PDF image extraction over a local HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-o", "--output", default="output/service", help="output root directory")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes (each keeps its own models loaded)")
+    parser.add_argument("--max-jobs", type=int, default=2, help="jobs processed at the same time")
+    parser.add_argument("--max-queue", type=int, default=16, help="jobs waiting in the queue before new uploads are rejected")
+    parser.add_argument("--pages-per-task", type=int, default=1, help="pages sent to a worker at once (progress granularity)")
+    parser.add_argument("--max-upload-mb", type=int, default=256)
+    parser.add_argument("--gpu", action="store_true")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(
+            args.host,
+            args.port,
+            output_root=args.output,
+            workers=args.workers,
+            max_jobs=args.max_jobs,
+            max_queue=args.max_queue,
+            pages_per_task=args.pages_per_task,
+            max_upload_bytes=args.max_upload_mb << 20,
+            gpu=args.gpu,
+        ))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
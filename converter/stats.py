@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+
+
+class PipelineStats:
+    """
+    記錄每個階段 (render / layout / xref_match / render_crop / text_layer / ocr / export) 的耗時與呼叫次數、
+    每一頁在各階段的耗時，以及各種計數 (xref 命中、重新渲染、OCR 區塊數、寫出的位元組數 ...)
+    report() 為可以直接存成 JSON 的 dict，不同 process 的 report 可以用 merge 合併
+    """
+    stages: dict # name -> {"seconds": float, "calls": int}
+    pages: dict # page_index -> {name: seconds}
+    counters: dict # name -> int
+
+    def __init__(self):
+        self.stages = {}
+        self.pages = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, page=None):
+        """
+        計時一個階段，page 可以是單一頁碼或頁碼 list (批次處理時耗時平均分給每一項)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, page)
+
+    def add_time(self, name: str, seconds: float, page=None, calls: int = 1):
+        s = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        s["seconds"] += seconds
+        s["calls"] += calls
+        if page is None:
+            return
+        page_list = page if isinstance(page, (list, tuple)) else [page]
+        if not page_list:
+            return
+        share = seconds / len(page_list)
+        for p in page_list:
+            per_page = self.pages.setdefault(p, {})
+            per_page[name] = per_page.get(name, 0.0) + share
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, report: dict):
+        """
+        合併另一個 PipelineStats 的 report() (例如 export_parallel 的 worker process)
+        """
+        for name, s in report.get("stages", {}).items():
+            self.add_time(name, s["seconds"], calls=s["calls"])
+        for p in report.get("pages", []):
+            per_page = self.pages.setdefault(p["page"] - 1, {})
+            for name, seconds in p.items():
+                if name != "page":
+                    per_page[name] = per_page.get(name, 0.0) + seconds
+        for name, n in report.get("counters", {}).items():
+            self.count(name, n)
+
+    def report(self) -> dict:
+        total = sum(s["seconds"] for s in self.stages.values()) or 1e-9
+        return {
+            "wall_seconds": round(time.perf_counter() - self._start, 4),
+            "stages": {
+                name: {"seconds": round(s["seconds"], 4), "calls": s["calls"], "share": round(s["seconds"] / total, 4)}
+                for name, s in sorted(self.stages.items(), key=lambda kv: -kv[1]["seconds"])
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "pages": [
+                {"page": p + 1, **{name: round(seconds, 4) for name, seconds in per_page.items()}}
+                for p, per_page in sorted(self.pages.items())
+            ],
+        }
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=4)
+
+
+@contextmanager
+def profile(path: str, backend: str = "cprofile"):
+    """
+    對 with 區塊做 profiling 並存到 path
+        "cprofile": 存成 .prof (可用 snakeviz / pstats 開啟)
+        "pyinstrument": 存成 .html，需要另外安裝 pyinstrument
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if backend == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    elif backend == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise ImportError("pyinstrument is not installed, run `pip install pyinstrument` or use backend=\"cprofile\"") from e
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+    else:
+        raise ValueError(f"Unknown profile backend: {backend}")
@@ -0,0 +1,61 @@
+import numpy as np
+import fitz  # PyMuPDF
+
+
+class PageTextIndex:
+    """
+    一頁的文字層 (每個字元與其座標)，只解析一次，之後的範圍查詢都在記憶體中完成
+    字元的中心點落在查詢範圍內即視為在範圍內
+    """
+    page_width: float
+    page_height: float
+
+    def __init__(self, page: fitz.Page):
+        self.page_width = page.rect.width
+        self.page_height = page.rect.height
+        chars = []
+        boxes = []
+        line_ids = []
+        line_no = 0
+        raw = page.get_text("rawdict")
+        for block in raw["blocks"]:
+            if block.get("type", 0) != 0:
+                continue # 圖片區塊
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    for ch in span["chars"]:
+                        chars.append(ch["c"])
+                        boxes.append(ch["bbox"])
+                        line_ids.append(line_no)
+                line_no += 1
+        self.chars = chars
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.cx = (boxes[:, 0] + boxes[:, 2]) / 2
+        self.cy = (boxes[:, 1] + boxes[:, 3]) / 2
+        self.line_ids = np.asarray(line_ids, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.chars)
+
+    def get_text(self, rect: fitz.Rect) -> str:
+        """
+        回傳中心點落在 rect 內 (含邊界) 的字元，依原本的閱讀順序排列，每一行文字後面接一個換行
+        輸出格式與 page.get_text("text", clip=rect) 相同，但選取的字元不一定相同:
+        MuPDF 的 clip 也會包含只有一部分在 rect 內的字元，這裡則以字元 bbox (rawdict) 的中心點判斷，
+        因此 rect 邊緣被切到的字元可能只出現在其中一邊的結果中
+        """
+        if not self.chars:
+            return ""
+        mask = (self.cx >= rect.x0) & (self.cx <= rect.x1) & (self.cy >= rect.y0) & (self.cy <= rect.y1)
+        idx = np.flatnonzero(mask)
+        if idx.size == 0:
+            return ""
+        lines = []
+        current = None
+        for i in idx:
+            line = self.line_ids[i]
+            if line != current:
+                lines.append([])
+                current = line
+            lines[-1].append(self.chars[i])
+        return "".join("".join(l) + "\n" for l in lines)
@@ -0,0 +1,18 @@
+import numpy as np
+from PIL import Image
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """
+    difference hash: 縮小成 (hash_size+1) x hash_size 的灰階圖後比較相鄰像素
+    內容相同但經過重新渲染 / 縮放的圖片會得到相同或非常接近的值
+    """
+    img = Image.fromarray(image).convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    px = np.asarray(img, dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).flatten()
+    value = 0
+    for b in bits:
+        value = (value << 1) | int(b)
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
@@ -0,0 +1,29 @@
+import numpy as np
+
+class _PixmapBuffer:
+    """
+    透過 __array_interface__ 將 pixmap 的記憶體提供給 numpy
+    data 以 (指標, read_only) 提供時 numpy 會把這個物件當作陣列的 base，
+    因此陣列 (以及由它切出來的 view) 還在使用時 pixmap 不會被釋放
+    (若直接提供 samples_mv，base 會是 memoryview，pixmap 被回收後 view 會指向已釋放的記憶體)
+    """
+    def __init__(self, pix):
+        self.pix = pix
+        if hasattr(pix, "samples_ptr"):
+            data = (pix.samples_ptr, False)
+        else:
+            data = pix.samples # 舊版 PyMuPDF 沒有 samples_ptr，samples 為複製出來的 bytes
+        self.__array_interface__ = {
+            "shape": (pix.h, pix.w, pix.n),
+            "typestr": "|u1",
+            "data": data,
+            "strides": (pix.stride, pix.n, 1),
+            "version": 3,
+        }
+
+def pixmap_to_array(pix) -> np.ndarray:
+    """
+    直接在 pix.samples 的記憶體上建立 (h, w, n) 的 numpy 陣列，不會複製資料
+    陣列會持有 pixmap 的參考，陣列還在使用時 pixmap 不會被釋放
+    """
+    return np.asarray(_PixmapBuffer(pix))
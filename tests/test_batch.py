@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+from converter import batch
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    """
+    三份 (內容不重要的) PDF 與一個記錄呼叫的 process_pdf，名稱含 "bad" 的文件會失敗
+    """
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    for name in ("a.pdf", "b.pdf", "bad.pdf"):
+        (pdf_dir / name).write_bytes(b"%PDF-1.4\n")
+    calls = []
+
+    def fake_process_pdf(pdf_path, output, *args, **kwargs):
+        calls.append(os.path.basename(pdf_path))
+        if "bad" in os.path.basename(pdf_path):
+            return {"status": batch.STATUS_FAILED, "seconds": 0.0, "error": "boom"}
+        os.makedirs(output, exist_ok=True)
+        with open(os.path.join(output, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump({"imgs": []}, f)
+        return {"status": batch.STATUS_DONE, "pages": 1, "images": 0, "seconds": 0.0, "error": None}
+
+    monkeypatch.setattr(batch, "process_pdf", fake_process_pdf)
+    monkeypatch.setattr(batch.model_pool, "warmup", lambda *args, **kwargs: None)
+    pdfs = batch.collect_pdfs([str(pdf_dir)])
+    return pdfs, str(tmp_path / "out"), calls
+
+
+def _status(manifest):
+    return {os.path.basename(p): d["status"] for p, d in manifest.docs.items()}
+
+
+def test_first_run_processes_everything(corpus):
+    pdfs, out, calls = corpus
+    manifest = batch.run(pdfs, out)
+    assert sorted(calls) == ["a.pdf", "b.pdf", "bad.pdf"]
+    assert _status(manifest) == {"a.pdf": "done", "b.pdf": "done", "bad.pdf": "failed"}
+    assert _status(batch.Manifest(manifest.path)) == _status(manifest)
+
+
+def test_resume_skips_done_and_retries_failed(corpus):
+    pdfs, out, calls = corpus
+    batch.run(pdfs, out)
+    calls.clear()
+    batch.run(pdfs, out)
+    assert calls == ["bad.pdf"]
+    calls.clear()
+    batch.run(pdfs, out, retry_failed=False)
+    assert calls == []
+
+
+def test_partial_documents_are_rerun(corpus):
+    pdfs, out, calls = corpus
+    manifest = batch.run(pdfs, out)
+    a, b = pdfs[0], pdfs[1]
+    # a: 標記為 done 但輸出不完整；b: 執行到一半中斷
+    os.remove(os.path.join(manifest.docs[a]["output"], "metadata.json"))
+    manifest.update(b, status=batch.STATUS_RUNNING)
+    calls.clear()
+    manifest = batch.run(pdfs, out, retry_failed=False)
+    assert sorted(calls) == ["a.pdf", "b.pdf"]
+    assert _status(manifest)["a.pdf"] == "done" and _status(manifest)["b.pdf"] == "done"
+
+
+def test_truncated_manifest(corpus):
+    pdfs, out, calls = corpus
+    manifest = batch.run(pdfs, out)
+    with open(manifest.path, "rb") as f:
+        data = f.read()
+    with open(manifest.path, "wb") as f:
+        f.write(data[:len(data) // 2])
+    calls.clear()
+    manifest = batch.run(pdfs, out)
+    assert sorted(calls) == ["a.pdf", "b.pdf", "bad.pdf"]
+    assert _status(batch.Manifest(manifest.path))["a.pdf"] == "done"
@@ -0,0 +1,108 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("cv2")
+
+from converter.img_data import ImgData
+from converter.pdf_info import PdfInfo
+
+PAGE_W, PAGE_H = 595, 842
+
+
+class StubOcrEngine:
+    """
+    以裁切區塊的像素值當作辨識結果，可以分辨每個結果來自哪一個區塊
+    """
+    det_model = "stub_det"
+    rec_model = "stub_rec"
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.batches = []
+
+    @staticmethod
+    def _read(crop):
+        return [f"v{int(crop[..., 0].max())}"]
+
+    def predict(self, crop):
+        return [{"rec_texts": self._read(crop)}]
+
+    def predict_batch(self, images, batch_size=None):
+        batch_size = batch_size or self.batch_size
+        results = []
+        for i in range(0, len(images), batch_size):
+            batch = images[i:i + batch_size]
+            self.batches.append(len(batch))
+            results.extend({"rec_texts": self._read(crop)} for crop in batch)
+        return results
+
+
+def _make_pages(tmp_path, n_pages):
+    doc = fitz.open()
+    for _ in range(n_pages):
+        doc.new_page(width=PAGE_W, height=PAGE_H)
+    path = str(tmp_path / "blank.pdf")
+    doc.save(path)
+    return path
+
+
+def _page_imgdatas(page_index, page, engine, first_value):
+    """
+    每頁兩張圖片，每張圖片有一個圖說與兩個文字區塊，每個區塊填入不同的像素值
+    回傳 (ImgData list, 每張圖片預期的 (圖說, 文字) 結果, 下一個可用的像素值)
+    """
+    boxes = []
+    for top in (60, 460):
+        boxes += [
+            {"label": "image", "coordinate": [100, top, 300, top + 200]},
+            {"label": "figure_title", "coordinate": [100, top + 200, 300, top + 220]},
+            {"label": "text", "coordinate": [320, top, 560, top + 60]},
+            {"label": "text", "coordinate": [320, top + 80, 560, top + 140]},
+        ]
+    value = first_value
+    texts = {}
+    for box in boxes:
+        if box["label"] != "image":
+            x1, y1, x2, y2 = box["coordinate"]
+            page[y1:y2, x1:x2] = value
+            texts[id(box)] = f"v{value}"
+            value += 1
+    imgdatas = []
+    expected = []
+    for i, box in enumerate(boxes):
+        if box["label"] == "image":
+            img = ImgData(page, boxes, i, ocr_engine=engine)
+            img.img_page = page_index
+            imgdatas.append(img)
+            expected.append((
+                texts[id(img.image_figure_title_box)],
+                [texts[id(b)] for b in img.image_surrounding_text_boxes],
+            ))
+    return imgdatas, expected, value
+
+
+@pytest.mark.parametrize("batch_ocr", [True, False])
+def test_ocr_results_written_back_to_their_imgdata(tmp_path, monkeypatch, batch_ocr):
+    monkeypatch.chdir(tmp_path)
+    pdf = PdfInfo(_make_pages(tmp_path, 3))
+    engine = StubOcrEngine(batch_size=4)
+    pdf.ocr_engine = engine
+
+    pages = {}
+    imgdatas = []
+    expected = []
+    value = 1
+    for page_index in range(3):
+        pages[page_index] = np.full((PAGE_H, PAGE_W, 3), 255, dtype=np.uint8)
+        page_imgs, page_expected, value = _page_imgdatas(page_index, pages[page_index], engine, value)
+        imgdatas += page_imgs
+        expected += page_expected
+
+    pdf._describe_images(imgdatas, lambda page_index: pages[page_index], batch_ocr=batch_ocr, ocr_batch_size=4)
+
+    assert [(img.image_figure_title_text, img.image_surrounding_texts) for img in imgdatas] == expected
+    if batch_ocr:
+        # 3 頁 x 2 張圖片 x (1 個圖說 + 3 個文字區塊)，每批最多 4 個
+        assert sum(engine.batches) == 24
+        assert max(engine.batches) == 4
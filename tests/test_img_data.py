@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("fitz")
+
+from converter.distance import box_distance
+from converter.img_data import ImgData
+
+
+def _reference(page_boxes, image_box_index, figure_title_threshold=0.05):
+    """
+    原本逐一呼叫 box_distance 的實作
+    """
+    image_coordinate = page_boxes[image_box_index]["coordinate"]
+    diagonal = np.linalg.norm(np.array(image_coordinate[2:], dtype=float) - np.array(image_coordinate[:2], dtype=float))
+    min_figure_title_distance = diagonal * figure_title_threshold
+    min_figure_title = None
+    text_distances = []
+    for box in page_boxes:
+        d = box_distance(image_coordinate, box["coordinate"], type="min")
+        if box["label"] == "figure_title":
+            if d < min_figure_title_distance:
+                min_figure_title = box
+                min_figure_title_distance = d
+        elif box["label"] == "text":
+            text_distances.append((box, d))
+    text_distances.sort(key=lambda x: x[1])
+    return min_figure_title, [box for box, _ in text_distances[:3]]
+
+
+def _random_page(rng):
+    # 座標落在很小的格點上，讓相鄰 / 重疊 (距離為 0) 與相同距離的情況經常出現
+    boxes = [{"label": "image", "coordinate": [40, 40, 80, 80]}]
+    for _ in range(rng.randint(1, 12)):
+        x = rng.randint(0, 12) * 10
+        y = rng.randint(0, 12) * 10
+        boxes.append({
+            "label": rng.choice(["text", "text", "text", "figure_title"]),
+            "coordinate": [x, y, x + rng.randint(1, 4) * 10, y + rng.randint(1, 4) * 10],
+        })
+    rng.shuffle(boxes)
+    return boxes
+
+
+def test_matches_box_distance_loop_with_ties():
+    rng = random.Random(0)
+    page = np.zeros((200, 200, 3), dtype=np.uint8)
+    for _ in range(2000):
+        boxes = _random_page(rng)
+        image_box_index = next(i for i, b in enumerate(boxes) if b["label"] == "image")
+        img = ImgData(page, boxes, image_box_index, ocr_engine=object())
+        title, texts = _reference(boxes, image_box_index)
+        assert img.image_figure_title_box is title
+        assert [id(b) for b in img.image_surrounding_text_boxes] == [id(b) for b in texts]
+
+
+def test_tied_distances_keep_page_order():
+    boxes = [{"label": "image", "coordinate": [100, 100, 200, 200]}]
+    # 到圖片的距離依序為 [2, 0, 0, 1, 0, 0]
+    for d in [2, 0, 0, 1, 0, 0]:
+        boxes.append({"label": "text", "coordinate": [200 + d, 120, 260, 140]})
+    img = ImgData(np.zeros((300, 300, 3), dtype=np.uint8), boxes, 0, ocr_engine=object())
+    position = {id(b): i - 1 for i, b in enumerate(boxes)}
+    assert [position[id(b)] for b in img.image_surrounding_text_boxes] == [1, 2, 4]
@@ -0,0 +1,45 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from converter.native_layout import has_vector_graphics, is_born_digital
+from converter.placement_index import PagePlacementIndex
+
+TEXT = "This report describes the quarterly results of the project. " * 4
+
+
+def _page(draw=None):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    page.insert_textbox(fitz.Rect(50, 50, 545, 200), TEXT, fontsize=11)
+    if draw is not None:
+        draw(page)
+    return doc, page
+
+
+def _bar_chart(page):
+    page.draw_line(fitz.Point(100, 600), fitz.Point(400, 600))
+    page.draw_line(fitz.Point(100, 600), fitz.Point(100, 380))
+    for i, h in enumerate([120, 180, 90, 200]):
+        x = 120 + i * 70
+        page.draw_rect(fitz.Rect(x, 600 - h, x + 40, 600), fill=(0.2, 0.4, 0.8))
+
+
+def test_text_only_page_is_born_digital():
+    doc, page = _page()
+    assert not has_vector_graphics(page)
+    assert is_born_digital(page, PagePlacementIndex(page))
+
+
+def test_vector_chart_goes_to_layout_model():
+    doc, page = _page(_bar_chart)
+    assert has_vector_graphics(page)
+    assert not is_born_digital(page, PagePlacementIndex(page))
+
+
+def test_rules_and_background_are_ignored():
+    def decorate(page):
+        page.draw_rect(page.rect, color=None, fill=(1, 1, 0.9)) # 背景色
+        page.draw_line(fitz.Point(50, 40), fitz.Point(545, 40)) # 頁首分隔線
+    doc, page = _page(decorate)
+    assert not has_vector_graphics(page)
@@ -0,0 +1,79 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("cv2")
+
+from converter.pdf_info import PdfInfo
+
+
+def _noise_png(seed, size=64):
+    # 雜訊圖片幾乎無法壓縮，原始資料大小約為 size * size * 3
+    pixels = np.random.default_rng(seed).integers(0, 255, (size, size, 3), dtype=np.uint8)
+    return fitz.Pixmap(fitz.csRGB, size, size, pixels.tobytes(), False).tobytes("png"), pixels
+
+
+@pytest.fixture
+def pdf_with_images(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    pixels = {}
+    for k in range(6):
+        data, arr = _noise_png(k)
+        xref = page.insert_image(fitz.Rect(20 + 90 * k, 20, 100 + 90 * k, 100), stream=data)
+        pixels[xref] = arr
+    path = str(tmp_path / "images.pdf")
+    doc.save(path)
+    return path, pixels
+
+
+def test_xref_cache_is_bounded_by_bytes(pdf_with_images):
+    path, pixels = pdf_with_images
+    pdf = PdfInfo(path)
+    sizes = {xref: len(pdf.pdf_doc.extract_image(xref)["image"]) for xref in pixels}
+    pdf.xref_cache_bytes = sum(sorted(sizes.values())[:3])
+    xrefs = list(pixels)
+    for xref in xrefs + xrefs[::-1]:
+        pdf.extract_xref(xref)
+        assert pdf.pdf_xref_bytes <= pdf.xref_cache_bytes
+        assert pdf.pdf_xref_bytes == sum(len(info["image"]) for info in pdf.pdf_xref_images.values())
+    # 最近使用的留在快取中
+    assert list(pdf.pdf_xref_images)[-1] == xrefs[0]
+
+
+def test_decode_xref_keeps_only_raw_bytes(pdf_with_images):
+    path, pixels = pdf_with_images
+    pdf = PdfInfo(path)
+    for xref, arr in pixels.items():
+        first = pdf.decode_xref(xref)
+        np.testing.assert_array_equal(first, arr)
+        # 每次都重新解碼，快取中不保留解碼後的陣列
+        assert pdf.decode_xref(xref) is not first
+        assert set(pdf.pdf_xref_images[xref]) >= {"image", "ext"}
+        assert not any(isinstance(v, np.ndarray) for v in pdf.pdf_xref_images[xref].values())
+
+
+def test_image_larger_than_cache_is_not_kept(pdf_with_images):
+    path, pixels = pdf_with_images
+    pdf = PdfInfo(path)
+    pdf.xref_cache_bytes = 10
+    xref = next(iter(pixels))
+    np.testing.assert_array_equal(pdf.decode_xref(xref), pixels[xref])
+    assert len(pdf.pdf_xref_images) == 0 and pdf.pdf_xref_bytes == 0
+
+
+@pytest.mark.parametrize("image_format", ["jpx", "gif", "tiff", ""])
+def test_unsupported_image_format(tmp_path, image_format):
+    doc = fitz.open()
+    doc.new_page()
+    path = str(tmp_path / "blank.pdf")
+    doc.save(path)
+    with pytest.raises(ValueError, match="Unsupported image format"):
+        PdfInfo(path, image_format=image_format)
+
+
+@pytest.mark.parametrize("image_format", ["png", "JPEG", "jpg", "webp"])
+def test_supported_image_format(pdf_with_images, image_format):
+    path, _ = pdf_with_images
+    assert PdfInfo(path, image_format=image_format).image_format == image_format.lower()
@@ -0,0 +1,40 @@
+import gc
+
+import pytest
+
+np = pytest.importorskip("numpy")
+fitz = pytest.importorskip("fitz")
+
+from converter.tools.pixmap import pixmap_to_array
+
+
+def _render():
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=200)
+    page.draw_rect(fitz.Rect(20, 20, 120, 160), color=(0, 0, 1), fill=(1, 0, 0))
+    return doc, page, page.get_pixmap(dpi=72)
+
+
+def test_view_keeps_pixmap_alive():
+    doc, page, pix = _render()
+    expected = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n).copy()
+
+    crop = pixmap_to_array(pix)[10:150, 15:130]
+    del pix
+    gc.collect()
+    # 配置相同大小、內容不同的 pixmap，若原本的記憶體已被釋放就會被覆寫
+    others = []
+    for _ in range(10):
+        other = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 200), False)
+        other.set_rect(other.irect, (0, 255, 0))
+        others.append(other)
+
+    assert np.array_equal(crop, expected[10:150, 15:130])
+    assert others
+
+
+def test_no_copy():
+    doc, page, pix = _render()
+    arr = pixmap_to_array(pix)
+    assert arr.shape == (pix.h, pix.w, pix.n)
+    assert arr.__array_interface__["data"][0] == pix.samples_ptr
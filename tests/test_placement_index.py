@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from converter.pdf_info import match_xref_for_rect
+from converter.placement_index import PagePlacementIndex
+
+
+def _png(color):
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False)
+    pix.clear_with(color)
+    return pix.tobytes("png")
+
+
+def _random_page(rng):
+    """
+    隨機擺放幾張內嵌圖片，其中部分 xref 會在同一頁出現多次，座標刻意對齊或跨過 64pt 的網格邊界
+    """
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    xrefs = []
+    for k in range(rng.randint(1, 6)):
+        x0 = rng.choice([rng.uniform(0, 500), 64 * rng.randint(0, 7), 64 * rng.randint(1, 7) - 0.5])
+        y0 = rng.choice([rng.uniform(0, 750), 64 * rng.randint(0, 11), 64 * rng.randint(1, 11) - 0.5])
+        rect = fitz.Rect(x0, y0, x0 + rng.uniform(5, 200), y0 + rng.uniform(5, 200))
+        if xrefs and rng.random() < 0.3:
+            page.insert_image(rect, xref=rng.choice(xrefs))
+        else:
+            xrefs.append(page.insert_image(rect, stream=_png(k * 40)))
+    return doc, page
+
+
+def _random_query(rng):
+    x0 = rng.choice([rng.uniform(-20, 600), 64 * rng.randint(0, 9) - rng.uniform(0, 2)])
+    y0 = rng.choice([rng.uniform(-20, 850), 64 * rng.randint(0, 13) - rng.uniform(0, 2)])
+    w = rng.choice([rng.uniform(0.5, 10), rng.uniform(10, 300), 64.0, 128.0])
+    h = rng.choice([rng.uniform(0.5, 10), rng.uniform(10, 300), 64.0, 128.0])
+    return fitz.Rect(x0, y0, x0 + w, y0 + h)
+
+
+def _same(got, expected):
+    assert got[0] == expected[0]
+    assert got[2] == pytest.approx(expected[2], abs=1e-6)
+    if expected[1] is None:
+        assert got[1] is None
+    else:
+        assert tuple(got[1]) == pytest.approx(tuple(expected[1]), abs=1e-3)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_index_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    doc, page = _random_page(rng)
+    index = PagePlacementIndex(page)
+    queries = [_random_query(rng) for _ in range(40)]
+    # 也查詢圖片本身的位置，確保完全重疊 (coverage = 1) 時的結果一致
+    queries += [fitz.Rect(r) for _, r in index.placements]
+    expected = [match_xref_for_rect(page, q) for q in queries]
+    for q, e in zip(queries, expected):
+        _same(index.match(q), e)
+    for got, e in zip(index.match_many(queries), expected):
+        _same(got, e)
+
+
+def test_box_straddling_cell_boundary():
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    xref = page.insert_image(fitz.Rect(60, 60, 70, 70), stream=_png(0))
+    index = PagePlacementIndex(page)
+    assert len(index._grid) == 4
+    for q in [fitz.Rect(50, 50, 63.9, 63.9), fitz.Rect(64.1, 64.1, 80, 80), fitz.Rect(63, 0, 65, 200)]:
+        got = index.match(q)
+        assert got[0] == xref
+        _same(got, match_xref_for_rect(page, q))
+    assert index.match(fitz.Rect(0, 0, 59, 59))[0] is None
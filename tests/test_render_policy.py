@@ -0,0 +1,49 @@
+import gc
+
+import pytest
+
+np = pytest.importorskip("numpy")
+fitz = pytest.importorskip("fitz")
+
+from converter.render_policy import RenderPolicy
+
+
+def _page():
+    doc = fitz.open()
+    page = doc.new_page(width=300, height=200)
+    page.draw_rect(fitz.Rect(30, 30, 200, 150), color=(0, 0, 1), fill=(1, 0, 0))
+    page.draw_circle(fitz.Point(220, 120), 40, fill=(0, 0.5, 0))
+    return doc, page
+
+
+def _reference(page, rect, dpi):
+    pix = page.get_pixmap(dpi=dpi, clip=rect, colorspace=fitz.csRGB, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n).copy()
+
+
+def _overwrite_freed_memory():
+    others = []
+    for _ in range(10):
+        other = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 400, 400), False)
+        other.clear_with(77)
+        others.append(other)
+    return others
+
+
+@pytest.mark.parametrize("tile_max_pixels", [2048 * 2048, 64 * 64])
+def test_render_survives_pixmap_release(tile_max_pixels):
+    doc, page = _page()
+    rect = fitz.Rect(20, 20, 280, 180)
+    policy = RenderPolicy(tile_max_pixels=tile_max_pixels)
+
+    img = policy.render(page, rect, 144)
+    gc.collect()
+    others = _overwrite_freed_memory()
+
+    expected = _reference(page, rect, 144)
+    assert img.shape[2] == 3
+    h = min(img.shape[0], expected.shape[0])
+    w = min(img.shape[1], expected.shape[1])
+    # 分塊渲染的邊界可能有 1 px 的取整差異
+    assert np.mean(img[:h, :w] != expected[:h, :w]) < 0.02
+    assert others
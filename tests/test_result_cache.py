@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from converter.batch import get_result_cache
+from converter.result_cache import ResultCache, layout_key, ocr_key
+
+
+def _page(seed=0):
+    return np.random.default_rng(seed).integers(0, 255, (40, 30, 3), dtype=np.uint8)
+
+
+def test_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    boxes = [{"label": "image", "score": np.float32(0.5), "coordinate": np.array([1.0, 2.0, 3.0, 4.0])}]
+    key = layout_key(_page(), "PP-DocLayout_plus-L", 100)
+    assert cache.get(key) is None
+    cache.put(key, boxes)
+    assert cache.get(key) == [{"label": "image", "score": 0.5, "coordinate": [1.0, 2.0, 3.0, 4.0]}]
+    # 另一個實例 (例如下一次執行) 也讀得到
+    assert ResultCache(str(tmp_path)).get(key) == cache.get(key)
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_keys_depend_on_content_model_and_dpi():
+    page = _page()
+    base = layout_key(page, "model-a", 100)
+    assert layout_key(page.copy(), "model-a", 100) == base
+    assert layout_key(page, "model-b", 100) != base
+    assert layout_key(page, "model-a", 150) != base
+    assert layout_key(_page(1), "model-a", 100) != base
+    # 相同像素不同形狀
+    assert layout_key(page.reshape(30, 40, 3), "model-a", 100) != base
+
+    crop = page[5:20, 5:20]
+    base = ocr_key(crop, "det", "rec")
+    assert ocr_key(np.ascontiguousarray(crop), "det", "rec") == base
+    assert ocr_key(crop, "det2", "rec") != base
+    assert ocr_key(crop, "det", "rec2") != base
+
+
+def _disk_bytes(path):
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _, files in os.walk(path) for f in files if f.endswith(".json"))
+
+
+def test_eviction_keeps_size_under_limit_and_drops_oldest(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=4000)
+    keys = [layout_key(_page(i), "m", 100) for i in range(60)]
+    for i, key in enumerate(keys):
+        cache.put(key, ["x" * 200])
+        os.utime(cache._path(key), (i, i)) # 固定使用順序
+    assert _disk_bytes(tmp_path) <= 4000
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[-1]) == ["x" * 200]
+
+
+def test_eviction_counts_other_writers(tmp_path):
+    # 兩個實例 (代表兩個 worker process) 寫入同一個目錄
+    a = ResultCache(str(tmp_path), max_bytes=4000)
+    b = ResultCache(str(tmp_path), max_bytes=4000)
+    for i in range(60):
+        (a if i % 2 else b).put(layout_key(_page(i), "m", 100), ["x" * 200])
+    assert _disk_bytes(tmp_path) <= 4000 * 1.2
+
+
+def test_batch_reuses_one_cache_per_process(tmp_path):
+    assert get_result_cache(None) is None
+    assert get_result_cache(str(tmp_path)) is get_result_cache(str(tmp_path))
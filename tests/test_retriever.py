@@ -0,0 +1,298 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from clip_faiss import MultiModalRetriever, JsonBlob, TextBlob
+
+
+def _baseline_rerank(r, cands, q_text, q_img, topk, alpha, beta_title, beta_sur):
+    """
+    原本逐一候選計分的實作 (每個 query 一次)
+    """
+    results = []
+    for qi, row in enumerate(cands):
+        hits = []
+        for idx in sorted(set(row.tolist()) - {-1}):
+            s_title = float(np.dot(q_text[qi], r.v_title[idx]))
+            a, b = r.chunk_offsets[idx], r.chunk_offsets[idx + 1]
+            if a == b:
+                s_sur, best_chunk = 0.0, None
+            else:
+                scores = r.v_chunks[a:b] @ q_text[qi]
+                best_i = int(np.argmax(scores))
+                s_sur, best_chunk = float(scores[best_i]), r.chunk_texts[int(a + best_i)]
+            s_img = float(np.dot(q_img[qi], r.v_img[idx]))
+            s_text = beta_title * s_title + beta_sur * s_sur
+            hits.append({
+                "score": alpha * s_text + (1 - alpha) * s_img,
+                "s_text": s_text,
+                "s_title": s_title,
+                "s_sur": s_sur,
+                "s_img": s_img,
+                "best_sur_chunk": best_chunk,
+                **r.meta[idx],
+            })
+        hits.sort(key=lambda h: h["score"], reverse=True)
+        results.append(hits[:topk])
+    return results
+
+
+def _vectors(rng, n, dim):
+    # 小整數 / 4 的向量: float32 內積沒有捨入誤差，相同分數 (平手) 在兩種實作中都完全相同
+    return (rng.integers(-2, 3, (n, dim)) / 4).astype(np.float32)
+
+
+def _retriever(rng, n_images=30, dim=8):
+    r = MultiModalRetriever(query_cache_size=0)
+    r.text_dim = r.image_dim = dim
+    r.v_title = _vectors(rng, n_images, dim)
+    r.v_img = _vectors(rng, n_images, dim)
+    # 重複的向量: 不同圖片得到相同分數
+    r.v_title[1] = r.v_title[0]
+    r.v_img[1] = r.v_img[0]
+    counts = rng.integers(0, 4, n_images) # 部分圖片沒有 chunk
+    counts[1] = counts[0]
+    r.chunk_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    r.v_chunks = _vectors(rng, int(counts.sum()), dim)
+    r.v_chunks[r.chunk_offsets[1]:r.chunk_offsets[2]] = r.v_chunks[r.chunk_offsets[0]:r.chunk_offsets[1]]
+    if counts[3] >= 2:
+        r.v_chunks[r.chunk_offsets[3] + 1] = r.v_chunks[r.chunk_offsets[3]] # 同一張圖片中相同的 chunk
+    r.chunk_texts = TextBlob()
+    r.chunk_texts.extend(f"chunk {i}" for i in range(int(counts.sum())))
+    r.meta = JsonBlob()
+    r.meta.extend({"image_name": f"image_{i}"} for i in range(n_images))
+    return r
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_rerank_matches_baseline(seed):
+    rng = np.random.default_rng(seed)
+    r = _retriever(rng)
+    n_queries, dim = 6, r.text_dim
+    q_text, q_img = _vectors(rng, n_queries, dim), _vectors(rng, n_queries, dim)
+    q_text[1] = q_text[0] # 重複的 query
+    q_img[1] = q_img[0]
+    cands = rng.integers(-1, len(r.meta), (n_queries, 12))
+    cands[:, :2] = [0, 1] # 平手的兩張圖片
+    cands[2] = -1 # 沒有任何候選
+    cands[3, 4:] = -1
+    for topk in (1, 3, 100):
+        got = r._rerank(cands, q_text, q_img, topk, 0.5, 0.5, 0.5)
+        expected = _baseline_rerank(r, cands, q_text, q_img, topk, 0.5, 0.5, 0.5)
+        assert got == expected
+    assert got[2] == []
+
+
+def test_rerank_without_any_candidate():
+    r = _retriever(np.random.default_rng(0))
+    q = np.ones((2, r.text_dim), dtype=np.float32)
+    assert r._rerank(np.full((2, 6), -1), q, q, 5, 0.6, 0.7, 0.3) == [[], []]
+
+
+@pytest.fixture
+def small_db(tmp_path):
+    pytest.importorskip("faiss")
+    pytest.importorskip("PIL")
+    from benchmark import StubEncoder, build_synthetic_folder
+    folder = build_synthetic_folder(str(tmp_path / "doc"), n_images=6)
+    r = MultiModalRetriever(text_model=StubEncoder(16), image_model=StubEncoder(8), index_type="flat")
+    r.add_document(str(tmp_path / "doc" / "metadata.json"), folder)
+    return r
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 64])
+def test_search_batch_matches_search(small_db, batch_size):
+    queries = ["香菇 種植", "table yield", "香菇 種植", small_db.meta[3]["figure_title"], ""]
+    # k_each 與 topk 都大於索引中的圖片數 (FAISS 以 -1 補齊)
+    kwargs = dict(topk=10, k_each=50)
+    expected = [small_db.search(q, **kwargs) for q in queries]
+    got = small_db.search_batch(queries, batch_size=batch_size, **kwargs)
+    assert got == expected
+    assert [len(hits) for hits in got] == [6] * len(queries)
+    assert got[0] == got[2]
+    assert got[3][0]["image_name"] == small_db.meta[3]["image_name"]
+
+
+def test_search_batch_small_k(small_db):
+    queries = ["香菇", "figure growth", "香菇"]
+    assert small_db.search_batch(queries, topk=2, k_each=1) == [small_db.search(q, topk=2, k_each=1) for q in queries]
+    assert small_db.search_batch([]) == []
+
+
+# ----------------------------
+# Save / load
+# ----------------------------
+@pytest.mark.parametrize("mmap", [True, False])
+def test_text_blob_round_trip(tmp_path, mmap):
+    data, offsets = str(tmp_path / "t.bin"), str(tmp_path / "t_offsets.npy")
+    blob = TextBlob()
+    blob.save(data, offsets) # 空的 blob
+    assert list(TextBlob.load(data, offsets, mmap=mmap)) == []
+
+    first = ["香菇", "", "a\nb", "圖 1 🍄"]
+    blob = TextBlob.load(data, offsets, mmap=mmap)
+    blob.extend(first)
+    blob.save(data, offsets)
+    blob = TextBlob.load(data, offsets, mmap=mmap)
+    assert list(blob) == first and blob[-1] == "圖 1 🍄"
+
+    # 對 mmap 開啟中的同一個檔案新增後再存
+    blob.extend(["more", ""])
+    assert list(blob) == first + ["more", ""]
+    blob.save(data, offsets)
+    assert list(TextBlob.load(data, offsets, mmap=mmap)) == first + ["more", ""]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_json_blob_round_trip(tmp_path, mmap):
+    data, offsets = str(tmp_path / "m.bin"), str(tmp_path / "m_offsets.npy")
+    items = [{"image_name": "圖 1", "page": 1, "coordinate": [0, 1.5, 2, 3]}, {}, {"occurrences": [{"page": None}]}]
+    blob = JsonBlob()
+    blob.extend(items[:2])
+    blob.save(data, offsets)
+    assert blob[0] == items[0] # save 後仍可從 pending 取用
+    blob = JsonBlob.load(data, offsets, mmap=mmap)
+    blob.extend(items[2:])
+    assert list(blob) == items
+    blob.save(data, offsets)
+    loaded = JsonBlob.load(data, offsets, mmap=mmap)
+    assert list(loaded) == items and loaded[-1] == items[-1]
+
+
+def _add_synthetic(r, tmp_path, name, n_images, seed):
+    from benchmark import build_synthetic_folder
+    folder = build_synthetic_folder(str(tmp_path / name), n_images=n_images, seed=seed)
+    return r.add_document(os.path.join(folder, "metadata.json"), folder)
+
+
+def _new_retriever(**kwargs):
+    from benchmark import StubEncoder
+    return MultiModalRetriever(text_model=StubEncoder(16), image_model=StubEncoder(8), **kwargs)
+
+
+def _load(db_dir, mmap=True):
+    from benchmark import StubEncoder
+    return MultiModalRetriever.load(db_dir, text_model=StubEncoder(16), image_model=StubEncoder(8), mmap=mmap)
+
+
+def _same_store(a, b):
+    for name in ("v_title", "v_img", "v_sur_pool", "v_chunks", "chunk_offsets"):
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+    assert list(a.chunk_texts) == list(b.chunk_texts)
+    assert list(a.meta) == list(b.meta)
+    assert (a.text_dim, a.image_dim) == (b.text_dim, b.image_dim)
+    for name in ("title_index", "sur_index", "img_index"):
+        assert getattr(a, name).ntotal == getattr(b, name).ntotal
+
+
+QUERIES = ["香菇 種植", "table yield", "病蟲害"]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_append_resave(tmp_path, mmap):
+    pytest.importorskip("faiss")
+    pytest.importorskip("PIL")
+    db = str(tmp_path / "db")
+    reference = _new_retriever()
+    _add_synthetic(reference, tmp_path, "a", 5, seed=1)
+    reference.save(db)
+
+    r = _load(db, mmap=mmap)
+    _same_store(r, reference)
+    assert r.search_batch(QUERIES) == reference.search_batch(QUERIES)
+
+    # 載入後新增文件並存回同一個資料夾 (mmap 開啟中的檔案會被取代)
+    _add_synthetic(reference, tmp_path, "b", 4, seed=2)
+    _add_synthetic(r, tmp_path, "b", 4, seed=2)
+    r.save(db)
+    for reload_mmap in (True, False):
+        loaded = _load(db, mmap=reload_mmap)
+        _same_store(loaded, reference)
+        assert len(loaded.meta) == 9
+        assert loaded.search_batch(QUERIES) == reference.search_batch(QUERIES)
+
+
+def test_load_legacy_npz(tmp_path):
+    faiss = pytest.importorskip("faiss")
+    pytest.importorskip("PIL")
+    reference = _new_retriever()
+    _add_synthetic(reference, tmp_path, "a", 5, seed=1)
+
+    # 舊版格式: vectors.npz (object array，需要 pickle) + meta.json，config 沒有 format_version
+    db = str(tmp_path / "legacy")
+    os.makedirs(db)
+    for name in ("title", "sur", "img"):
+        faiss.write_index(getattr(reference, f"{name}_index"), os.path.join(db, f"{name}.faiss"))
+    offsets = reference.chunk_offsets
+    v_sur_chunks = np.empty(len(offsets) - 1, dtype=object)
+    sur_chunks_text = np.empty(len(offsets) - 1, dtype=object)
+    for i in range(len(offsets) - 1):
+        v_sur_chunks[i] = reference.v_chunks[offsets[i]:offsets[i + 1]]
+        sur_chunks_text[i] = [reference.chunk_texts[j] for j in range(offsets[i], offsets[i + 1])]
+    np.savez(
+        os.path.join(db, "vectors.npz"),
+        v_title=reference.v_title,
+        v_img=reference.v_img,
+        v_sur_chunks=v_sur_chunks,
+        sur_chunks_text=sur_chunks_text,
+        text_dim=reference.text_dim,
+        image_dim=reference.image_dim,
+    )
+    with open(os.path.join(db, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(list(reference.meta), f, ensure_ascii=False)
+    with open(os.path.join(db, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"text_model_name": reference.text_model_name, "image_model_name": reference.image_model_name}, f)
+
+    r = _load(db)
+    _same_store(r, reference)
+    assert r.search_batch(QUERIES) == reference.search_batch(QUERIES)
+
+    # 再次 save 後改存成新的格式
+    r.save(db)
+    with open(os.path.join(db, "config.json"), "r", encoding="utf-8") as f:
+        assert json.load(f)["format_version"] == 2
+    _same_store(_load(db), reference)
+
+
+def test_ivf_mmap_load_to_memory_and_write(tmp_path):
+    faiss = pytest.importorskip("faiss")
+    pytest.importorskip("PIL")
+    from clip_faiss import has_mmap_invlists, load_invlists_to_memory, is_trained_ann
+    params = {"nlist": 4, "min_train_per_list": 5}
+    r = _new_retriever(index_type="ivf_flat", index_params=params)
+    _add_synthetic(r, tmp_path, "a", 30, seed=1)
+    assert is_trained_ann(r.title_index)
+    db = str(tmp_path / "db")
+    r.save(db)
+
+    mapped = _load(db, mmap=True)
+    assert mapped._mmap_invlists and has_mmap_invlists(mapped.title_index)
+    assert mapped.search_batch(QUERIES) == r.search_batch(QUERIES)
+
+    # 讀進記憶體後寫出的檔案不再參照原本的檔案
+    load_invlists_to_memory(mapped.title_index)
+    assert not has_mmap_invlists(mapped.title_index)
+    path = str(tmp_path / "title_copy.faiss")
+    faiss.write_index(mapped.title_index, path)
+    copy = faiss.read_index(path)
+    src = faiss.extract_index_ivf(r.title_index).invlists
+    dst = faiss.extract_index_ivf(copy).invlists
+    for l in range(src.nlist):
+        n = src.list_size(l)
+        assert dst.list_size(l) == n
+        if n:
+            np.testing.assert_array_equal(faiss.rev_swig_ptr(dst.get_ids(l), n), faiss.rev_swig_ptr(src.get_ids(l), n))
+
+    # mmap 載入後新增並存回同一個資料夾
+    in_memory = _load(db, mmap=False)
+    _add_synthetic(mapped, tmp_path, "b", 6, seed=2)
+    _add_synthetic(in_memory, tmp_path, "b", 6, seed=2)
+    assert not mapped._mmap_invlists
+    mapped.save(db)
+    reloaded = _load(db, mmap=True)
+    _same_store(reloaded, in_memory)
+    assert reloaded.title_index.ntotal == 36
+    assert reloaded.search_batch(QUERIES) == in_memory.search_batch(QUERIES)
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from converter import service
+from converter.service import ExtractionService
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_submit_writes_upload_off_the_event_loop(tmp_path, monkeypatch):
+    writers = []
+    write_file = service._write_file
+
+    def record(path, data):
+        writers.append(threading.current_thread())
+        write_file(path, data)
+
+    monkeypatch.setattr(service, "_write_file", record)
+
+    async def main():
+        svc = ExtractionService(output_root=str(tmp_path), max_queue=2)
+        svc._queue = asyncio.Queue(maxsize=svc.max_queue)
+        job = await svc.submit(b"%PDF-1.7 test", name="a.pdf")
+        return job, svc._queue.get_nowait()
+
+    job, queued = _run(main())
+    assert queued is job
+    with open(job.pdf_path, "rb") as f:
+        assert f.read() == b"%PDF-1.7 test"
+    assert writers and writers[0] is not threading.main_thread()
+
+
+def test_queue_full_removes_upload(tmp_path):
+    async def main():
+        svc = ExtractionService(output_root=str(tmp_path), max_queue=1)
+        svc._queue = asyncio.Queue(maxsize=svc.max_queue)
+        # 兩個請求同時寫檔，只有一個放得進佇列
+        return await asyncio.gather(svc.submit(b"%PDF-1"), svc.submit(b"%PDF-2"), return_exceptions=True)
+
+    results = _run(main())
+    assert sum(isinstance(r, asyncio.QueueFull) for r in results) == 1
+    assert len(os.listdir(tmp_path)) == 1
+    # 寫檔前就已經滿了: 不會建立任何檔案
+    async def full():
+        svc = ExtractionService(output_root=str(tmp_path), max_queue=1)
+        svc._queue = asyncio.Queue(maxsize=svc.max_queue)
+        svc._queue.put_nowait(None)
+        await svc.submit(b"%PDF-3")
+
+    with pytest.raises(asyncio.QueueFull):
+        _run(full())
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from converter.stats import PipelineStats
+
+
+def _worker(pages, seconds, xref_hits):
+    stats = PipelineStats()
+    for p in pages:
+        stats.add_time("render", seconds, p)
+        stats.count("pages_rendered")
+    stats.add_time("layout", seconds * len(pages), list(pages)) # 批次處理，平均分給每一頁
+    stats.count("xref_hits", xref_hits)
+    # 經過 JSON，與 worker process 傳回來的 report 相同
+    return json.loads(json.dumps(stats.report()))
+
+
+def test_merge_sums_worker_reports():
+    main = PipelineStats()
+    main.add_time("export", 0.5)
+    main.count("bytes_written", 100)
+    main.merge(_worker([0, 1], 0.25, 3))
+    main.merge(_worker([2, 3, 4], 0.125, 0))
+    main.merge(_worker([1], 1.0, 2)) # 與第一個 worker 重疊的頁面也會相加
+
+    assert main.stages["render"] == {"seconds": pytest.approx(0.25 * 2 + 0.125 * 3 + 1.0), "calls": 6}
+    assert main.stages["layout"] == {"seconds": pytest.approx(0.5 + 0.375 + 1.0), "calls": 3}
+    assert main.stages["export"] == {"seconds": 0.5, "calls": 1}
+    assert main.counters == {"bytes_written": 100, "pages_rendered": 6, "xref_hits": 5}
+    # report 中的頁碼從 1 開始，合併後回到 0-based
+    assert sorted(main.pages) == [0, 1, 2, 3, 4]
+    assert main.pages[0] == {"render": pytest.approx(0.25), "layout": pytest.approx(0.25)}
+    assert main.pages[1] == {"render": pytest.approx(1.25), "layout": pytest.approx(1.25)}
+    assert main.pages[4] == {"render": pytest.approx(0.125), "layout": pytest.approx(0.125)}
+
+    report = main.report()
+    assert [p["page"] for p in report["pages"]] == [1, 2, 3, 4, 5]
+    assert sum(s["share"] for s in report["stages"].values()) == pytest.approx(1.0, abs=1e-3)
+
+
+def test_merge_empty_report():
+    main = PipelineStats()
+    main.merge({})
+    main.merge(PipelineStats().report())
+    assert (main.stages, main.pages, main.counters) == ({}, {}, {})
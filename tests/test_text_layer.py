@@ -0,0 +1,47 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from converter.text_layer import PageTextIndex
+
+
+@pytest.fixture
+def page():
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    page.insert_text((100, 100), "Hello World", fontsize=12)
+    page.insert_text((100, 130), "Second line", fontsize=12)
+    yield page
+    doc.close()
+
+
+def _char_boxes(page):
+    return [ch["bbox"] for b in page.get_text("rawdict")["blocks"] for l in b["lines"] for s in l["spans"] for ch in s["chars"]]
+
+
+def test_whole_lines_match_clip(page):
+    index = PageTextIndex(page)
+    for rect in [page.rect, fitz.Rect(50, 80, 400, 110), fitz.Rect(50, 110, 400, 140), fitz.Rect(0, 0, 50, 50)]:
+        assert index.get_text(rect) == page.get_text("text", clip=rect)
+
+
+def test_char_center_on_edge(page):
+    index = PageTextIndex(page)
+    x0, y0, x1, y1 = _char_boxes(page)[0] # "H"
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    # 中心點剛好在邊界上: 包含
+    assert index.get_text(fitz.Rect(0, 80, cx, 110)) == "H\n"
+    assert index.get_text(fitz.Rect(0, cy, 595, 842)) == "Hello World\nSecond line\n"
+    # 中心點在外面，即使 bbox 有一部分在 rect 內也不包含
+    assert index.get_text(fitz.Rect(0, 80, cx - 0.01, 110)) == ""
+    assert index.get_text(fitz.Rect(0, cy + 0.01, 595, 110)) == ""
+
+
+def test_partial_line(page):
+    index = PageTextIndex(page)
+    boxes = _char_boxes(page)
+    # 從 "World" 的 W 開始到頁面右邊
+    w = boxes[len("Hello ")]
+    assert index.get_text(fitz.Rect(w[0], 80, 595, 110)) == "World\n"
+    assert len(index) == len(boxes)
+    assert PageTextIndex(fitz.open().new_page()).get_text(fitz.Rect(0, 0, 100, 100)) == ""